@@ -0,0 +1,306 @@
+"""
+Write-behind analytics pipeline backed by an append-only SQLite store
+"""
+import asyncio
+import math
+import sqlite3
+import os
+import time
+from typing import List, Dict, Optional, Any
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+EVENT_COLUMNS = [
+    "event_type",
+    "conversation_id",
+    "user_query",
+    "response_time_ms",
+    "was_helpful",
+    "category",
+    "timestamp",
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_type TEXT NOT NULL,
+    conversation_id TEXT,
+    user_query TEXT,
+    response_time_ms REAL,
+    was_helpful INTEGER,
+    category TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_category_latency
+    ON analytics_events (category, response_time_ms);
+CREATE INDEX IF NOT EXISTS idx_analytics_timestamp_helpful
+    ON analytics_events (timestamp, was_helpful);
+"""
+
+# Bucket width (ISO timestamp prefix length) for time-series aggregates
+TIME_BUCKETS = {
+    "hour": 13,
+    "day": 10,
+    "month": 7,
+}
+
+
+class AnalyticsStore:
+    """Append-only SQLite store for analytics events"""
+
+    def __init__(self, db_path: str = "./analytics.db"):
+        self.db_path = db_path
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Single write connection, only ever used by the background writer
+        self._write_conn = self._connect()
+        self._write_conn.executescript(SCHEMA)
+        self._write_conn.commit()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection with WAL so readers never block the writer"""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def insert_many(self, events: List[Dict[str, Any]]) -> int:
+        """Bulk insert a batch of events in a single transaction"""
+        if not events:
+            return 0
+
+        rows = []
+        for event in events:
+            was_helpful = event.get("was_helpful")
+            rows.append((
+                event["event_type"],
+                event.get("conversation_id"),
+                event.get("user_query"),
+                event.get("response_time_ms"),
+                None if was_helpful is None else int(was_helpful),
+                event.get("category"),
+                event["timestamp"],
+            ))
+
+        placeholders = ", ".join("?" for _ in EVENT_COLUMNS)
+        with self._write_conn:
+            self._write_conn.executemany(
+                f"INSERT INTO analytics_events ({', '.join(EVENT_COLUMNS)}) "
+                f"VALUES ({placeholders})",
+                rows
+            )
+
+        return len(rows)
+
+    def latency_percentile_by_category(
+        self,
+        percentile: float = 0.95
+    ) -> List[Dict[str, Any]]:
+        """
+        Latency percentile per category.
+
+        Walks the (category, response_time_ms) index: one count per category,
+        then a single OFFSET seek into the already-sorted index range.
+        """
+        conn = self._connect()
+        try:
+            counts = conn.execute(
+                "SELECT category, COUNT(response_time_ms) FROM analytics_events "
+                "WHERE response_time_ms IS NOT NULL GROUP BY category"
+            ).fetchall()
+
+            results = []
+            for category, count in counts:
+                if count == 0:
+                    continue
+                # Nearest rank: the smallest value with at least `percentile` of values at or below it
+                offset = max(math.ceil(percentile * count) - 1, 0)
+
+                if category is None:
+                    where = "category IS NULL"
+                    params: tuple = ()
+                else:
+                    where = "category = ?"
+                    params = (category,)
+
+                row = conn.execute(
+                    f"SELECT response_time_ms FROM analytics_events "
+                    f"WHERE {where} AND response_time_ms IS NOT NULL "
+                    f"ORDER BY response_time_ms LIMIT 1 OFFSET ?",
+                    params + (offset,)
+                ).fetchone()
+
+                results.append({
+                    "category": category or "uncategorized",
+                    "percentile": percentile,
+                    "response_time_ms": row[0] if row else None,
+                    "sample_count": count
+                })
+
+            return results
+        finally:
+            conn.close()
+
+    def helpful_rate_over_time(
+        self,
+        bucket: str = "day",
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Share of helpful feedback per time bucket (covered by the timestamp index)"""
+        if bucket not in TIME_BUCKETS:
+            raise ValueError(f"Unknown bucket '{bucket}', expected one of {list(TIME_BUCKETS)}")
+
+        prefix_len = TIME_BUCKETS[bucket]
+        clauses = ["was_helpful IS NOT NULL"]
+        params: List[str] = []
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp < ?")
+            params.append(until)
+
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                f"SELECT substr(timestamp, 1, {prefix_len}) AS bucket, "
+                f"SUM(was_helpful), COUNT(*) FROM analytics_events "
+                f"WHERE {' AND '.join(clauses)} "
+                f"GROUP BY bucket ORDER BY bucket",
+                params
+            ).fetchall()
+        finally:
+            conn.close()
+
+        return [
+            {
+                "bucket": bucket_key,
+                "helpful_rate": helpful / total if total else None,
+                "feedback_count": total
+            }
+            for bucket_key, helpful, total in rows
+        ]
+
+    def close(self):
+        """Close the write connection"""
+        self._write_conn.close()
+
+
+class AnalyticsPipeline:
+    """Bounded in-memory queue drained by a background batch writer"""
+
+    def __init__(
+        self,
+        store: AnalyticsStore,
+        max_queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 2.0
+    ):
+        self.store = store
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._pending: List[Dict[str, Any]] = []
+        self._inflight: Optional[asyncio.Future] = None
+        self.dropped_events = 0
+        self.written_events = 0
+
+    def start(self):
+        """Start the background writer on the running event loop"""
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._writer_task = asyncio.create_task(self._run_writer())
+        logger.info(
+            f"Analytics writer started (batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval}s)"
+        )
+
+    def enqueue(self, event: Dict[str, Any]) -> bool:
+        """Enqueue an event without waiting; drops it if the queue is full"""
+        if self.queue is None:
+            self.dropped_events += 1
+            return False
+
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.dropped_events += 1
+            if self.dropped_events % 1000 == 1:
+                logger.warning(f"Analytics queue full, {self.dropped_events} events dropped so far")
+            return False
+
+    def enqueue_many(self, events: List[Dict[str, Any]]) -> int:
+        """Enqueue a batch of events, returns how many were accepted"""
+        return sum(1 for event in events if self.enqueue(event))
+
+    async def _run_writer(self):
+        """Collect events until the batch is full or the flush interval elapses"""
+        while True:
+            self._pending = [await self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    self._pending.append(
+                        await asyncio.wait_for(self.queue.get(), timeout=remaining)
+                    )
+                except asyncio.TimeoutError:
+                    break
+
+            batch, self._pending = self._pending, []
+            # Shielded so a shutdown mid-write neither loses nor duplicates the batch
+            self._inflight = asyncio.ensure_future(self._flush(batch))
+            await asyncio.shield(self._inflight)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        """Write a batch off the event loop"""
+        try:
+            self.written_events += await asyncio.to_thread(self.store.insert_many, batch)
+        except Exception as e:
+            logger.error(f"Error writing analytics batch of {len(batch)}: {str(e)}")
+
+    async def stop(self):
+        """Stop the writer and flush whatever is still queued"""
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+
+        if self._inflight is not None and not self._inflight.done():
+            await self._inflight
+
+        if self.queue is not None:
+            remaining, self._pending = self._pending, []
+            while not self.queue.empty():
+                remaining.append(self.queue.get_nowait())
+            if remaining:
+                await self._flush(remaining)
+
+        self.store.close()
+        logger.info(
+            f"Analytics writer stopped ({self.written_events} written, "
+            f"{self.dropped_events} dropped)"
+        )
+
+    def stats(self) -> Dict[str, int]:
+        """Queue and throughput counters"""
+        return {
+            "queued": self.queue.qsize() if self.queue else 0,
+            "written": self.written_events,
+            "dropped": self.dropped_events
+        }
@@ -1,12 +1,17 @@
 """
 LangChain RAG chat engine with conversation memory
 """
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Callable
 from langchain_openai import ChatOpenAI
+from langchain_core.language_models import BaseChatModel
 from langchain.chains import ConversationalRetrievalChain
 from langchain.memory import ConversationBufferMemory
 from langchain.prompts import PromptTemplate
 from langchain_community.vectorstores import Chroma
+from retrieval import FilteredRetriever, ConfidenceCalibration, build_metadata_filter, indexed_metadata_fields
+from reranker import ConfidenceGatedReranker
+from prefetch import RetrievalCache
+import itertools
 import logging
 import uuid
 import os
@@ -15,6 +20,12 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_PROMPT_PREAMBLE = (
+    "You are an expert IT helpdesk assistant for a company. Your role is to help "
+    "employees with technical issues in a friendly, professional, and efficient manner."
+)
+
+
 class ITHelpdeskChatEngine:
     """Chat engine for IT helpdesk with RAG and conversation memory"""
     
@@ -23,15 +34,35 @@ class ITHelpdeskChatEngine:
         vector_store: Chroma,
         model_name: str = "gpt-4o-mini",
         temperature: float = 0.7,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        retrieval_k: int = 3,
+        min_filtered_relevance: float = 0.3,
+        reranker: Optional[ConfidenceGatedReranker] = None,
+        adaptive_retrieval: bool = True,
+        escalation_confidence: float = 0.35,
+        prompt_preamble: Optional[str] = None,
+        llm: Optional[BaseChatModel] = None,
+        retrieval_cache: Optional[RetrievalCache] = None,
+        confidence_calibration: Optional[ConfidenceCalibration] = None,
+        adaptive_low_confidence: float = 0.4
     ):
         self.vector_store = vector_store
+        self.retrieval_cache = retrieval_cache
+        # None uses the calibration fitted for the index being searched
+        self.confidence_calibration = confidence_calibration
+        self.adaptive_low_confidence = adaptive_low_confidence
+        self.prompt_preamble = prompt_preamble
+        self.reranker = reranker
+        self.adaptive_retrieval = adaptive_retrieval
+        self.escalation_confidence = escalation_confidence
+        self.retrieval_k = retrieval_k
+        self.min_filtered_relevance = min_filtered_relevance
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
         
-        # Initialize LLM
-        self.llm = ChatOpenAI(
+        # Initialize LLM (a supplied model, e.g. the replay stub, takes precedence)
+        self.llm = llm or ChatOpenAI(
             model=model_name,
             temperature=temperature,
             max_tokens=max_tokens
@@ -40,12 +71,30 @@ class ITHelpdeskChatEngine:
         # Store conversation memories by conversation_id
         self.conversations: Dict[str, ConversationBufferMemory] = {}
         
+        # Serialized history per conversation, extended incrementally as
+        # messages are appended; the epoch changes whenever a conversation
+        # is (re)created so stale ETags never match
+        self._history_cache: Dict[str, List[Dict]] = {}
+        self._conversation_epochs: Dict[str, int] = {}
+        self._epoch_counter = itertools.count(1)
+        
         # Custom prompt template
         self.prompt_template = self._create_prompt_template()
     
+    def set_vector_store(self, vector_store: Optional[Chroma]):
+        """Repoint the engine (index swap or eviction), dropping the old store's cached results"""
+        previous, self.vector_store = self.vector_store, vector_store
+        if self.retrieval_cache is not None and previous is not vector_store:
+            self.retrieval_cache.discard(previous)
+    
     def _create_prompt_template(self) -> PromptTemplate:
         """Create custom prompt template for IT helpdesk"""
-        template = """You are an expert IT helpdesk assistant for a company. Your role is to help employees with technical issues in a friendly, professional, and efficient manner.
+        preamble = DEFAULT_PROMPT_PREAMBLE
+        if self.prompt_preamble:
+            # Escape braces so a custom preamble can't inject template variables
+            preamble = self.prompt_preamble.replace("{", "{{").replace("}", "}}")
+        
+        template = preamble + """
 
 Context from knowledge base:
 {context}
@@ -81,11 +130,22 @@ Your response:"""
                 return_messages=True,
                 output_key="answer"
             )
+            self._history_cache[conversation_id] = []
+            self._conversation_epochs[conversation_id] = next(self._epoch_counter)
         
         return self.conversations[conversation_id]
     
-    def _should_escalate(self, user_query: str, response: str) -> bool:
+    def _should_escalate(
+        self,
+        user_query: str,
+        response: str,
+        confidence: Optional[float] = None
+    ) -> bool:
         """Determine if query should be escalated to human support"""
+        # Nothing in the knowledge base clearly covers this issue
+        if confidence is not None and confidence < self.escalation_confidence:
+            return True
+        
         escalation_keywords = [
             "don't know",
             "not sure",
@@ -160,17 +220,85 @@ Your response:"""
         
         return actions[:4]  # Return top 4 suggestions
     
+    def _build_retrieval(
+        self,
+        user_message: str,
+        user_context: Optional[Dict] = None,
+        category: Optional[str] = None,
+        vector_store: Optional[Chroma] = None
+    ) -> Tuple[str, FilteredRetriever]:
+        """Build the retrieval query and retriever for a message"""
+        vector_store = vector_store or self.vector_store
+        
+        # Structured context (on fields this index has) becomes a metadata filter
+        metadata_filter, _ = build_metadata_filter(
+            category, user_context, indexed_metadata_fields(vector_store)
+        )
+        
+        # All of it also stays in the question, which is what the LLM answers
+        enhanced_query = user_message
+        if user_context:
+            context_str = " ".join([f"{k}: {v}" for k, v in user_context.items()])
+            enhanced_query = f"{user_message}\n\nUser context: {context_str}"
+        
+        retriever = FilteredRetriever(
+            vector_store=vector_store,
+            k=self.retrieval_k,
+            metadata_filter=metadata_filter,
+            min_relevance=self.min_filtered_relevance,
+            reranker=self.reranker,
+            adaptive=self.adaptive_retrieval,
+            cache=self.retrieval_cache,
+            calibration=self.confidence_calibration,
+            low_confidence=self.adaptive_low_confidence
+        )
+        return enhanced_query, retriever
+    
+    def prefetch(
+        self,
+        partial_message: str,
+        conversation_id: Optional[str] = None,
+        user_context: Optional[Dict] = None,
+        vector_store: Optional[Chroma] = None,
+        is_stale: Optional[Callable[[], bool]] = None
+    ) -> bool:
+        """
+        Warm the retrieval cache for a message the user is still typing.
+        
+        Only first turns are warmed: later turns are rephrased by the LLM
+        before retrieval, so the typed text is not what gets searched.
+        Returns whether a search ran.
+        """
+        if self.retrieval_cache is None:
+            return False
+        if conversation_id and self.get_message_count(conversation_id) > 0:
+            return False
+        
+        query, retriever = self._build_retrieval(partial_message, user_context, vector_store=vector_store)
+        retriever.count_cache_lookups = False
+        return retriever.warm(query, is_stale)
+    
     def chat(
         self,
         user_message: str,
         conversation_id: Optional[str] = None,
-        user_context: Optional[Dict] = None
-    ) -> Tuple[str, str, List[str], bool, List[str]]:
+        user_context: Optional[Dict] = None,
+        category: Optional[str] = None,
+        vector_store: Optional[Chroma] = None
+    ) -> Tuple[str, str, List[str], bool, List[str], Optional[float], str]:
         """
         Process user message and return response
         
+        Args:
+            category: Restrict retrieval to this knowledge base category
+                (e.g. from a quick action); falls back to a global search
+                when nothing relevant is found in it
+            vector_store: Index version to answer from; defaults to the
+                engine's current vector store
+        
         Returns:
-            Tuple of (response, conversation_id, sources, should_escalate, suggested_actions)
+            Tuple of (response, conversation_id, sources, should_escalate,
+            suggested_actions, confidence, category)
         """
         # Generate conversation ID if not provided
         if conversation_id is None:
@@ -181,17 +309,16 @@ Your response:"""
         # Get or create conversation memory
         memory = self._get_or_create_memory(conversation_id)
         
-        # Add user context to query if provided
-        enhanced_query = user_message
-        if user_context:
-            context_str = " ".join([f"{k}: {v}" for k, v in user_context.items()])
-            enhanced_query = f"{user_message}\n\nUser context: {context_str}"
+        enhanced_query, retriever = self._build_retrieval(
+            user_message, user_context, category, vector_store
+        )
         
         # Create retrieval chain
         qa_chain = ConversationalRetrievalChain.from_llm(
             llm=self.llm,
-            retriever=self.vector_store.as_retriever(search_kwargs={"k": 3}),
+            retriever=retriever,
             memory=memory,
+            combine_docs_chain_kwargs={"prompt": self.prompt_template},
             return_source_documents=True,
             verbose=False
         )
@@ -205,8 +332,13 @@ Your response:"""
         # Extract sources
         sources = self._extract_sources(source_documents)
         
+        # Confidence of the retrieval that grounded this answer
+        confidence = None
+        if retriever.retrieval_stats:
+            confidence = round(retriever.retrieval_stats["confidence"], 3)
+        
         # Determine if escalation needed
-        should_escalate = self._should_escalate(user_message, response)
+        should_escalate = self._should_escalate(user_message, response, confidence)
         
         # Get category from top source
         category = "general"
@@ -216,34 +348,79 @@ Your response:"""
         # Generate suggested actions
         suggested_actions = self._generate_suggested_actions(response, category)
         
-        logger.info(f"Response generated (escalate: {should_escalate})")
+        logger.info(f"Response generated (escalate: {should_escalate}, confidence: {confidence})")
         
-        return response, conversation_id, sources, should_escalate, suggested_actions
+        return response, conversation_id, sources, should_escalate, suggested_actions, confidence, category
     
     def clear_conversation(self, conversation_id: str) -> bool:
         """Clear conversation memory"""
         if conversation_id in self.conversations:
             del self.conversations[conversation_id]
+            self._history_cache.pop(conversation_id, None)
+            self._conversation_epochs.pop(conversation_id, None)
             logger.info(f"Cleared conversation {conversation_id}")
             return True
         return False
     
-    def get_conversation_history(self, conversation_id: str) -> List[Dict]:
-        """Get conversation history"""
-        if conversation_id not in self.conversations:
-            return []
-        
-        memory = self.conversations[conversation_id]
-        messages = memory.chat_memory.messages
+    def get_history_version(self, conversation_id: str) -> str:
+        """
+        Cheap version tag for a conversation's history (no serialization).
         
-        history = []
-        for msg in messages:
-            history.append({
+        Changes whenever a message is added or the conversation is recreated.
+        """
+        epoch = self._conversation_epochs.get(conversation_id, 0)
+        return f"{epoch}-{self.get_message_count(conversation_id)}"
+    
+    def get_message_count(self, conversation_id: str) -> int:
+        """Number of messages in a conversation"""
+        if conversation_id not in self.conversations:
+            return 0
+        return len(self.conversations[conversation_id].chat_memory.messages)
+    
+    def _serialized_history(self, conversation_id: str) -> List[Dict]:
+        """Serialize only messages appended since the last call"""
+        messages = self.conversations[conversation_id].chat_memory.messages
+        cache = self._history_cache.setdefault(conversation_id, [])
+        
+        for index in range(len(cache), len(messages)):
+            msg = messages[index]
+            cache.append({
+                "index": index,
                 "role": "user" if msg.type == "human" else "assistant",
                 "content": msg.content
             })
         
-        return history
+        return cache
+    
+    def get_conversation_history(
+        self,
+        conversation_id: str,
+        after: Optional[int] = None,
+        before: Optional[int] = None,
+        limit: Optional[int] = None
+    ) -> List[Dict]:
+        """
+        Get conversation history, optionally windowed by message index.
+        
+        Args:
+            after: Only messages with index greater than this ("since" mode)
+            before: Only messages with index less than this
+            limit: Maximum number of messages; counted from the oldest when
+                paging forward with ``after`` and from the newest otherwise
+        """
+        if conversation_id not in self.conversations:
+            return []
+        
+        history = self._serialized_history(conversation_id)
+        
+        start = 0 if after is None else max(after + 1, 0)
+        end = len(history) if before is None else max(min(before, len(history)), 0)
+        window = history[start:end]
+        
+        if limit is not None and len(window) > limit:
+            window = window[:limit] if after is not None else window[len(window) - limit:]
+        
+        return window
 
 
 # Quick action message mapping
@@ -285,9 +462,9 @@ if __name__ == "__main__":
     conv_id = None
     for query in test_queries:
         print(f"\nUser: {query}")
-        response, conv_id, sources, escalate, actions = chat_engine.chat(query, conv_id)
+        response, conv_id, sources, escalate, actions, confidence, category = chat_engine.chat(query, conv_id)
         print(f"Assistant: {response}")
         print(f"Sources: {sources}")
-        print(f"Escalate: {escalate}")
+        print(f"Escalate: {escalate} (confidence: {confidence})")
         print(f"Suggested actions: {actions}")
 
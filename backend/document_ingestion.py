@@ -0,0 +1,378 @@
+"""
+Ingestion of Markdown/HTML/text runbook directories into the knowledge base
+"""
+import os
+import re
+import json
+import hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from html.parser import HTMLParser
+from typing import List, Dict, Optional, Tuple, Any
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import Chroma
+from ingestion import PARSE_POOL_CONTEXT, ChunkRecord, embed_and_upsert
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+MANIFEST_FILENAME = "documents_manifest.json"
+
+SUPPORTED_EXTENSIONS = {
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".html": "html",
+    ".htm": "html",
+    ".txt": "text",
+}
+
+PRIORITIES = {"low", "medium", "high", "critical"}
+
+FRONT_MATTER_RE = re.compile(r"\A---\s*\n(.*?)\n---\s*\n", re.DOTALL)
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+class _HTMLToMarkdown(HTMLParser):
+    """Flattens HTML to text, keeping headings as Markdown and reading <meta> tags"""
+
+    BLOCK_TAGS = {"p", "div", "li", "tr", "br", "pre", "section", "article", "table", "ul", "ol"}
+    SKIP_TAGS = {"script", "style", "head"}
+
+    def __init__(self):
+        super().__init__()
+        self.parts: List[str] = []
+        self.meta: Dict[str, str] = {}
+        self.title: Optional[str] = None
+        self._heading_level = 0
+        self._skip_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "meta" and attrs.get("name") and attrs.get("content"):
+            self.meta[attrs["name"].lower()] = attrs["content"]
+        elif tag == "title":
+            self._in_title = True
+        elif tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif re.fullmatch(r"h[1-6]", tag):
+            self._heading_level = int(tag[1])
+            self.parts.append("\n\n" + "#" * self._heading_level + " ")
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+        if tag == "li":
+            self.parts.append("- ")
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+        elif tag in self.SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif re.fullmatch(r"h[1-6]", tag):
+            self._heading_level = 0
+            self.parts.append("\n\n")
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title = (self.title or "") + data.strip()
+        elif self._skip_depth == 0:
+            # Headings must stay on a single line to be detected later
+            self.parts.append(" ".join(data.split()) if self._heading_level else data)
+
+    def text(self) -> str:
+        return re.sub(r"\n{3,}", "\n\n", "".join(self.parts)).strip()
+
+
+def parse_front_matter(text: str) -> Tuple[Dict[str, str], str]:
+    """Split simple ``key: value`` front-matter from a Markdown/text body"""
+    match = FRONT_MATTER_RE.match(text)
+    if not match:
+        return {}, text
+
+    meta = {}
+    for line in match.group(1).splitlines():
+        if ":" not in line:
+            continue
+        key, value = line.split(":", 1)
+        value = value.strip().strip("'\"")
+        if value.startswith("[") and value.endswith("]"):
+            value = ",".join(item.strip().strip("'\"") for item in value[1:-1].split(","))
+        meta[key.strip().lower()] = value
+
+    return meta, text[match.end():]
+
+
+def split_by_headings(text: str) -> List[Tuple[List[str], str]]:
+    """Split Markdown into (heading path, section body) pairs"""
+    sections = []
+    path: List[str] = []
+    body: List[str] = []
+
+    def flush():
+        content = "\n".join(body).strip()
+        if content:
+            sections.append((list(path), content))
+
+    in_code_block = False
+    for line in text.splitlines():
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+
+        match = None if in_code_block else HEADING_RE.match(line)
+        if match:
+            flush()
+            body = []
+            level = len(match.group(1))
+            path = path[:level - 1] + [""] * max(level - 1 - len(path), 0) + [match.group(2)]
+        else:
+            body.append(line)
+
+    flush()
+    return sections
+
+
+def normalize_document_meta(meta: Dict[str, str], relpath: str = "") -> Dict[str, str]:
+    """
+    Lowercase category/priority so they match metadata filters (which are
+    lowercased) and drop priorities outside PRIORITIES.
+    """
+    meta = dict(meta)
+    if meta.get("category", "").strip():
+        meta["category"] = meta["category"].strip().lower()
+    else:
+        meta.pop("category", None)
+
+    priority = meta.pop("priority", "").strip().lower()
+    if priority in PRIORITIES:
+        meta["priority"] = priority
+    elif priority:
+        logger.warning(f"Ignoring unknown priority '{priority}' in {relpath or 'document'}")
+
+    return meta
+
+
+def _path_conventions(relpath: str) -> Dict[str, str]:
+    """Derive category/priority from ``<category>/[<priority>/]file`` layouts"""
+    parts = relpath.replace(os.sep, "/").split("/")[:-1]
+    meta = {}
+    if parts:
+        meta["category"] = parts[0].lower()
+    for part in parts[1:]:
+        if part.lower() in PRIORITIES:
+            meta["priority"] = part.lower()
+    return meta
+
+
+def _parse_document(
+    root: str,
+    relpath: str,
+    known_hash: Optional[str],
+    chunk_size: int,
+    chunk_overlap: int
+) -> Tuple[str, str, Optional[List[ChunkRecord]]]:
+    """
+    Parse and chunk a single file (runs in a worker process).
+
+    Returns (relpath, content hash, records); records is None when the hash
+    matches ``known_hash`` and the file does not need re-embedding.
+    """
+    with open(os.path.join(root, relpath), "rb") as f:
+        raw = f.read()
+
+    content_hash = hashlib.sha256(raw).hexdigest()
+    if content_hash == known_hash:
+        return relpath, content_hash, None
+
+    text = raw.decode("utf-8", errors="replace")
+    kind = SUPPORTED_EXTENSIONS[os.path.splitext(relpath)[1].lower()]
+
+    title = None
+    if kind == "html":
+        parser = _HTMLToMarkdown()
+        parser.feed(text)
+        meta = parser.meta
+        title = parser.title
+        text = parser.text()
+    else:
+        meta, text = parse_front_matter(text)
+
+    # Front-matter / <meta> wins over path conventions (unless it is invalid)
+    meta = {**_path_conventions(relpath), **normalize_document_meta(meta, relpath)}
+    stem = os.path.splitext(os.path.basename(relpath))[0]
+    title = meta.get("title") or title or stem.replace("_", " ").replace("-", " ")
+
+    base_metadata = {
+        "category": meta.get("category", "general"),
+        "issue": meta.get("issue", stem),
+        "priority": meta.get("priority", "medium"),
+        "keywords": meta.get("keywords", ""),
+        "source": f"IT Runbooks - {title}",
+        "doc_id": relpath,
+        "os": meta.get("os", "any").lower(),
+        "department": meta.get("department", "any").lower(),
+    }
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+    sections = split_by_headings(text) if kind != "text" else [([], text.strip())]
+    doc_key = hashlib.sha1(relpath.encode("utf-8")).hexdigest()[:16]
+
+    records = []
+    for heading_path, body in sections:
+        heading = " > ".join(h for h in heading_path if h)
+        prefix = f"{title}\n{heading}\n\n" if heading else f"{title}\n\n"
+        # Oversized sections fall back to the generic splitter, keeping the heading
+        for piece in text_splitter.split_text(body):
+            metadata = {**base_metadata, "section": heading}
+            records.append((prefix + piece, metadata, f"doc-{doc_key}-{len(records)}"))
+
+    return relpath, content_hash, records
+
+
+class DirectoryIngestor:
+    """
+    Incrementally ingests a directory tree of .md/.html/.txt files.
+
+    A manifest of (mtime, sha256, chunk IDs) per file lets unchanged files be
+    skipped without reading them and changed/deleted files replace their old
+    chunks. At most ``max_inflight_documents`` parsed files are held in
+    memory, and the manifest is saved every ``manifest_save_every`` files.
+    """
+
+    def __init__(
+        self,
+        vector_store: Chroma,
+        embeddings,
+        persist_directory: str,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        embed_batch_size: int = 256,
+        embed_concurrency: int = 4,
+        parse_workers: Optional[int] = None,
+        max_inflight_documents: int = 32,
+        manifest_save_every: int = 100
+    ):
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.manifest_path = os.path.join(persist_directory, MANIFEST_FILENAME)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.parse_workers = parse_workers
+        self.max_inflight_documents = max_inflight_documents
+        self.manifest_save_every = manifest_save_every
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.manifest_path}: {str(e)}")
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, Dict[str, Any]]):
+        os.makedirs(os.path.dirname(self.manifest_path) or ".", exist_ok=True)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def discover(root: str) -> Dict[str, float]:
+        """Map of relative path -> mtime for every supported file under root"""
+        files = {}
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                    path = os.path.join(dirpath, filename)
+                    files[os.path.relpath(path, root)] = os.path.getmtime(path)
+        return files
+
+    def _delete_chunks(self, chunk_ids: List[str]):
+        if chunk_ids:
+            self.vector_store._collection.delete(ids=chunk_ids)
+
+    def ingest(self, root: str) -> Dict[str, int]:
+        """Sync the vector store with the directory; returns counts per outcome"""
+        if not os.path.isdir(root):
+            raise FileNotFoundError(f"Documents directory not found: {root}")
+
+        manifest = self._load_manifest()
+        files = self.discover(root)
+        stats = {"added": 0, "updated": 0, "unchanged": 0, "removed": 0, "chunks": 0}
+
+        for relpath in set(manifest) - set(files):
+            self._delete_chunks(manifest.pop(relpath).get("chunk_ids", []))
+            stats["removed"] += 1
+
+        # mtime is the cheap first check; the hash (computed in the workers)
+        # catches touched-but-identical files
+        candidates = [
+            relpath for relpath, mtime in files.items()
+            if manifest.get(relpath, {}).get("mtime") != mtime
+        ]
+        stats["unchanged"] = len(files) - len(candidates)
+
+        if candidates:
+            logger.info(f"Parsing {len(candidates)} new or modified documents from {root}")
+
+            inflight = deque()
+            processed = 0
+
+            # Spawned, not forked: syncs also run inside the server during hot reloads
+            with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=PARSE_POOL_CONTEXT) as parse_pool, \
+                    ThreadPoolExecutor(max_workers=self.embed_concurrency) as embed_pool:
+
+                def drain_oldest():
+                    nonlocal processed
+                    relpath, content_hash, records = inflight.popleft().result()
+                    entry = manifest.get(relpath, {})
+
+                    if records is None:
+                        stats["unchanged"] += 1
+                    else:
+                        self._delete_chunks(entry.get("chunk_ids", []))
+                        stats["chunks"] += embed_and_upsert(
+                            self.vector_store, self.embeddings, records,
+                            embed_pool, self.embed_batch_size
+                        )
+                        stats["updated" if entry else "added"] += 1
+                        entry = {"chunk_ids": [chunk_id for _, _, chunk_id in records]}
+
+                    manifest[relpath] = {**entry, "mtime": files[relpath], "sha256": content_hash}
+
+                    # Chunk IDs are deterministic, so files finished since the
+                    # last save are simply redone after a crash
+                    processed += 1
+                    if processed % self.manifest_save_every == 0:
+                        self._save_manifest(manifest)
+
+                for relpath in candidates:
+                    inflight.append(parse_pool.submit(
+                        _parse_document, root, relpath,
+                        manifest.get(relpath, {}).get("sha256"),
+                        self.chunk_size, self.chunk_overlap
+                    ))
+                    if len(inflight) >= self.max_inflight_documents:
+                        drain_oldest()
+
+                while inflight:
+                    drain_oldest()
+
+        self._save_manifest(manifest)
+        logger.info(
+            f"Document sync complete: {stats['added']} added, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['removed']} removed, {stats['chunks']} chunks"
+        )
+        return stats
@@ -0,0 +1,328 @@
+"""
+Versioned knowledge base indexes with background rebuilds and atomic swaps
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Callable, Any
+from langchain_community.vectorstores import Chroma
+from knowledge_base import KnowledgeBaseLoader
+from document_ingestion import DirectoryIngestor
+from retrieval import calibrate_confidence, register_calibration, get_calibration
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+CURRENT_POINTER = "CURRENT"
+
+
+def close_vector_store(vector_store: Optional[Chroma]) -> bool:
+    """
+    Stop the chromadb System behind a persistent Chroma store.
+
+    chromadb caches one System per persist directory for the whole process
+    (SharedSystemClient), and that System keeps the sqlite file and HNSW
+    segments open and resident. Dropping the Chroma object frees nothing, so
+    this must run before an index is unloaded or its directory deleted.
+    Only call it for directories no other live store is using.
+    """
+    client = getattr(vector_store, "_client", None)
+    if client is None:
+        return False
+
+    try:
+        from chromadb.api.client import SharedSystemClient
+        cache = SharedSystemClient._identifer_to_system
+    except (ImportError, AttributeError):
+        # Stopping a System chromadb may still hand out would give the next
+        # store opened on this directory a dead client
+        logger.warning("chromadb System cache not found, leaving the chroma store open")
+        return False
+
+    try:
+        system = client._system
+    except (AttributeError, KeyError):
+        # Not a chroma client, or already closed
+        return False
+
+    for identifier, cached in list(cache.items()):
+        if cached is system:
+            del cache[identifier]
+
+    try:
+        system.stop()
+    except Exception as e:
+        logger.warning(f"Error stopping chroma system: {str(e)}")
+    return True
+
+
+def resident_chroma_systems() -> int:
+    """Number of chromadb Systems currently held in the process-wide cache"""
+    try:
+        from chromadb.api.client import SharedSystemClient
+        return len(SharedSystemClient._identifer_to_system)
+    except (ImportError, AttributeError):
+        return 0
+
+
+class IndexVersion:
+    """One built index plus the number of requests currently using it"""
+
+    def __init__(self, version_id: str, vector_store: Chroma, persist_directory: str, managed: bool):
+        self.version_id = version_id
+        self.vector_store = vector_store
+        self.persist_directory = persist_directory
+        # Only directories created by the manager are ever deleted
+        self.managed = managed
+        self.in_flight = 0
+        self.created_at = datetime.utcnow().isoformat()
+
+
+class IndexManager:
+    """
+    Serves the current index version while new versions build in the background.
+
+    Requests pin a version with ``acquire()``. ``reload()`` builds a fresh index
+    into its own directory, then swaps the references held by the loader and
+    chat engine in one step. Retired versions are deleted once their last
+    in-flight request has finished.
+    """
+
+    def __init__(
+        self,
+        kb_loader: KnowledgeBaseLoader,
+        loader_factory: Callable[[str], KnowledgeBaseLoader],
+        on_swap: Optional[Callable[[IndexVersion], None]] = None,
+        versions_directory: Optional[str] = None,
+        calibration_samples: int = 50
+    ):
+        self.kb_loader = kb_loader
+        self.loader_factory = loader_factory
+        self.on_swap = on_swap
+        self.versions_directory = versions_directory or f"{kb_loader.persist_directory}_versions"
+        self.calibration_samples = calibration_samples
+
+        self._lock = threading.Lock()
+        self._build_lock = asyncio.Lock()
+        self._retired: List[IndexVersion] = []
+        self.current: Optional[IndexVersion] = None
+        self.last_error: Optional[str] = None
+
+    def _pointer_path(self) -> str:
+        return os.path.join(self.versions_directory, CURRENT_POINTER)
+
+    def initialize(self) -> IndexVersion:
+        """Load the last published version, or the loader's base index"""
+        version_id = None
+        if os.path.exists(self._pointer_path()):
+            with open(self._pointer_path()) as f:
+                version_id = f.read().strip() or None
+
+        version_dir = os.path.join(self.versions_directory, version_id) if version_id else None
+        if version_dir and os.path.isdir(version_dir):
+            logger.info(f"Loading published index version {version_id}")
+            loader = self.loader_factory(version_dir)
+            self.current = IndexVersion(version_id, loader.initialize(), version_dir, managed=True)
+        else:
+            self.current = IndexVersion(
+                "initial",
+                self.kb_loader.initialize(),
+                self.kb_loader.persist_directory,
+                managed=False
+            )
+
+        self._calibrate(self.current)
+        self._apply(self.current)
+        return self.current
+
+    def pin(self) -> IndexVersion:
+        """Mark the current version as in use; pair with ``release()``"""
+        with self._lock:
+            version = self.current
+            version.in_flight += 1
+        return version
+
+    def release(self, version: IndexVersion):
+        """Release a version pinned with ``pin()``"""
+        with self._lock:
+            version.in_flight -= 1
+        self._collect_retired()
+
+    @contextmanager
+    def acquire(self):
+        """Pin the current version for the duration of a request"""
+        version = self.pin()
+        try:
+            yield version
+        finally:
+            self.release(version)
+
+    @property
+    def in_flight(self) -> int:
+        """Requests using any version managed here, including draining ones"""
+        with self._lock:
+            return sum(v.in_flight for v in [self.current, *self._retired] if v)
+
+    @property
+    def building(self) -> bool:
+        return self._build_lock.locked()
+
+    def _apply(self, version: IndexVersion):
+        """Point the loader (and any listeners) at a version"""
+        self.kb_loader.vector_store = version.vector_store
+        self.kb_loader.persist_directory = version.persist_directory
+        if self.on_swap:
+            self.on_swap(version)
+
+    def _build(self, version_id: str) -> IndexVersion:
+        """Build a complete new index in its own directory (runs in a thread)"""
+        version_dir = os.path.join(self.versions_directory, version_id)
+        loader = self.loader_factory(version_dir)
+        vector_store = loader.initialize(force_reload=True)
+        version = IndexVersion(version_id, vector_store, version_dir, managed=True)
+        self._calibrate(version)
+        return version
+
+    def _calibrate(self, version: IndexVersion):
+        """Fit retrieval confidence to this version's score distribution"""
+        if self.calibration_samples <= 0:
+            return
+        try:
+            calibration = calibrate_confidence(version.vector_store, sample_size=self.calibration_samples)
+        except Exception as e:
+            logger.warning(f"Confidence calibration failed for {version.version_id}, using defaults: {str(e)}")
+            return
+        if calibration:
+            register_calibration(version.vector_store, calibration)
+
+    async def reload(self) -> Optional[IndexVersion]:
+        """Build a new version in the background and swap it in; None if a build is running"""
+        if self.building:
+            return None
+
+        async with self._build_lock:
+            version_id = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:6]}"
+            logger.info(f"Building index version {version_id}...")
+
+            try:
+                new_version = await asyncio.to_thread(self._build, version_id)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Index build {version_id} failed, keeping {self.current.version_id}: {str(e)}")
+                shutil.rmtree(os.path.join(self.versions_directory, version_id), ignore_errors=True)
+                raise
+
+            with self._lock:
+                old_version, self.current = self.current, new_version
+                self._apply(new_version)
+                self._retired.append(old_version)
+
+            self._publish(new_version)
+            self.last_error = None
+            logger.info(f"Swapped index {old_version.version_id} -> {new_version.version_id}")
+
+            self._collect_retired()
+            return new_version
+
+    def _publish(self, version: IndexVersion):
+        """Record the live version so restarts pick it up"""
+        os.makedirs(self.versions_directory, exist_ok=True)
+        tmp_path = f"{self._pointer_path()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(version.version_id)
+        os.replace(tmp_path, self._pointer_path())
+
+    def _collect_retired(self):
+        """Drop retired versions that no request is using any more"""
+        with self._lock:
+            drained = [v for v in self._retired if v.in_flight == 0]
+            self._retired = [v for v in self._retired if v.in_flight > 0]
+
+        for version in drained:
+            # Unmanaged versions (the loader's base index) are kept on disk but
+            # still unloaded; chromadb's open files are released before deleting
+            close_vector_store(version.vector_store)
+            if version.managed:
+                shutil.rmtree(version.persist_directory, ignore_errors=True)
+            version.vector_store = None
+            logger.info(f"Garbage-collected index version {version.version_id}")
+
+    def close(self):
+        """Release every loaded version's chroma store (the manager is unusable afterwards)"""
+        with self._lock:
+            versions = [v for v in [self.current, *self._retired] if v]
+            self._retired = []
+        for version in versions:
+            close_vector_store(version.vector_store)
+            version.vector_store = None
+        self.kb_loader.vector_store = None
+
+    def sources_fingerprint(self) -> str:
+        """
+        Digest of every source file's path, mtime and size, used by the watcher.
+
+        Unlike a file count plus newest mtime this also notices renames and
+        edits that restore an older mtime (``cp -p``, ``git checkout``).
+        """
+        paths = []
+        if os.path.exists(self.kb_loader.csv_path):
+            paths.append(os.path.abspath(self.kb_loader.csv_path))
+        docs_directory = self.kb_loader.docs_directory
+        if docs_directory and os.path.isdir(docs_directory):
+            paths.extend(
+                os.path.join(docs_directory, relpath)
+                for relpath in DirectoryIngestor.discover(docs_directory)
+            )
+
+        digest = hashlib.sha256()
+        for path in sorted(paths):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Deleted since it was listed; the next poll sees the final state
+                continue
+            digest.update(f"{path}\0{stat.st_mtime_ns}\0{stat.st_size}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    async def watch(self, interval: float):
+        """Poll the sources and rebuild when they change"""
+        fingerprint = await asyncio.to_thread(self.sources_fingerprint)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                latest = await asyncio.to_thread(self.sources_fingerprint)
+                if latest != fingerprint and not self.building:
+                    logger.info("Knowledge base sources changed, rebuilding index")
+                    # Recorded before building: sources that fail to build are
+                    # retried once they change again, not on every poll
+                    fingerprint = latest
+                    await self.reload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Knowledge base watcher error: {str(e)}")
+
+    def status(self) -> Dict[str, Any]:
+        """Current version, build state and versions waiting to drain"""
+        calibration = get_calibration(self.current.vector_store) if self.current else None
+        with self._lock:
+            return {
+                "current_version": self.current.version_id if self.current else None,
+                "current_created_at": self.current.created_at if self.current else None,
+                "in_flight": self.current.in_flight if self.current else 0,
+                "building": self.building,
+                "draining": [
+                    {"version": v.version_id, "in_flight": v.in_flight}
+                    for v in self._retired
+                ],
+                "last_error": self.last_error,
+                "resident_chroma_systems": resident_chroma_systems(),
+                "confidence_calibration": calibration.as_dict() if calibration else None
+            }
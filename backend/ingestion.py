@@ -0,0 +1,321 @@
+"""
+Streaming, resumable ingestion pipeline for large knowledge bases
+"""
+import os
+import json
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Dict, Optional, Callable, Tuple, Any
+import pandas as pd
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.docstore.document import Document
+from langchain_community.vectorstores import Chroma
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+CHECKPOINT_FILENAME = "ingest_checkpoint.json"
+
+# Parse pools may be started from the running server (hot reloads build in a
+# thread); forking a multithreaded process can copy held locks into workers
+PARSE_POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+# (text, metadata, id) triples produced by the workers
+ChunkRecord = Tuple[str, Dict[str, Any], str]
+
+
+def _optional_field(row: Dict[str, Any], column: str) -> str:
+    value = row.get(column)
+    if value is None or pd.isna(value) or not str(value).strip():
+        return "any"
+    return str(value).strip().lower()
+
+
+def build_csv_document(row: Dict[str, Any], doc_id: int) -> Document:
+    """Build a knowledge base document from a CSV row"""
+    content = f"""Category: {row['category']}
+Issue: {row['issue']}
+Priority: {row['priority']}
+
+Solution:
+{row['solution']}
+
+Keywords: {row['keywords']}
+"""
+
+    metadata = {
+        "category": row['category'],
+        "issue": row['issue'],
+        "priority": row['priority'],
+        "keywords": row['keywords'],
+        "source": f"IT Knowledge Base - {row['category'].title()}",
+        "doc_id": doc_id,
+        # Optional columns; rows without them apply to everyone
+        "os": _optional_field(row, "os"),
+        "department": _optional_field(row, "department")
+    }
+
+    return Document(page_content=content, metadata=metadata)
+
+
+def _split_rows(
+    rows: List[Dict[str, Any]],
+    start_index: int,
+    chunk_size: int,
+    chunk_overlap: int
+) -> List[ChunkRecord]:
+    """Build and split documents for a block of rows (runs in a worker process)"""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""]
+    )
+
+    records = []
+    for offset, row in enumerate(rows):
+        doc_id = start_index + offset
+        document = build_csv_document(row, doc_id)
+        for chunk_no, chunk in enumerate(text_splitter.split_documents([document])):
+            # Deterministic IDs make re-ingesting a block after a crash an upsert
+            records.append((chunk.page_content, chunk.metadata, f"kb-{doc_id}-{chunk_no}"))
+
+    return records
+
+
+def embed_and_upsert(
+    vector_store: Chroma,
+    embeddings,
+    records: List[ChunkRecord],
+    embed_pool: ThreadPoolExecutor,
+    batch_size: int
+) -> int:
+    """Embed chunks in bounded batches on ``embed_pool`` and upsert them"""
+    batches = [records[i:i + batch_size] for i in range(0, len(records), batch_size)]
+
+    # pool.map keeps at most max_workers embedding requests in flight
+    embedded = embed_pool.map(
+        lambda batch: embeddings.embed_documents([text for text, _, _ in batch]),
+        batches
+    )
+
+    written = 0
+    for batch, vectors in zip(batches, embedded):
+        vector_store._collection.upsert(
+            ids=[chunk_id for _, _, chunk_id in batch],
+            embeddings=vectors,
+            documents=[text for text, _, _ in batch],
+            metadatas=[metadata for _, metadata, _ in batch]
+        )
+        written += len(batch)
+
+    return written
+
+
+class IngestionCheckpoint:
+    """Progress marker persisted next to the vector store"""
+
+    def __init__(self, path: str, source_fingerprint: str):
+        self.path = path
+        self.source_fingerprint = source_fingerprint
+        self.rows_done = 0
+        self.chunks_written = 0
+        self.completed = False
+
+    @classmethod
+    def load(cls, path: str, source_fingerprint: str) -> "IngestionCheckpoint":
+        """Load a checkpoint, starting over if the source file changed"""
+        checkpoint = cls(path, source_fingerprint)
+        if not os.path.exists(path):
+            return checkpoint
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {path}: {str(e)}")
+            return checkpoint
+
+        if data.get("source_fingerprint") != source_fingerprint:
+            logger.info("Source changed since last checkpoint, starting from the beginning")
+            return checkpoint
+
+        checkpoint.rows_done = data.get("rows_done", 0)
+        checkpoint.chunks_written = data.get("chunks_written", 0)
+        checkpoint.completed = data.get("completed", False)
+        return checkpoint
+
+    def save(self):
+        """Atomically persist the checkpoint"""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "source_fingerprint": self.source_fingerprint,
+                "rows_done": self.rows_done,
+                "chunks_written": self.chunks_written,
+                "completed": self.completed,
+                "updated_at": time.time()
+            }, f)
+        os.replace(tmp_path, self.path)
+
+
+def file_fingerprint(path: str) -> str:
+    """Cheap identity for a source file (path, size, mtime)"""
+    stat = os.stat(path)
+    return f"{os.path.abspath(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def has_incomplete_checkpoint(persist_directory: str) -> bool:
+    """Whether a previous ingestion into this directory was interrupted"""
+    path = os.path.join(persist_directory, CHECKPOINT_FILENAME)
+    if not os.path.exists(path):
+        return False
+
+    try:
+        with open(path) as f:
+            return not json.load(f).get("completed", False)
+    except (OSError, ValueError):
+        return True
+
+
+class StreamingCSVIngestor:
+    """
+    Streams a knowledge base CSV into a Chroma collection.
+
+    Rows are read in blocks, split into chunks in a process pool, embedded in
+    bounded batches on a small thread pool and written to the collection block
+    by block. Peak memory is bounded by ``max_inflight_blocks * rows_per_block``
+    rows, and a checkpoint after every written block makes the run resumable.
+    """
+
+    def __init__(
+        self,
+        vector_store: Chroma,
+        embeddings,
+        persist_directory: str,
+        rows_per_block: int = 1000,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 200,
+        embed_batch_size: int = 256,
+        embed_concurrency: int = 4,
+        parse_workers: Optional[int] = None,
+        max_inflight_blocks: int = 4,
+        progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        self.vector_store = vector_store
+        self.embeddings = embeddings
+        self.persist_directory = persist_directory
+        self.rows_per_block = rows_per_block
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embed_batch_size = embed_batch_size
+        self.embed_concurrency = embed_concurrency
+        self.parse_workers = parse_workers
+        self.max_inflight_blocks = max_inflight_blocks
+        self.progress_callback = progress_callback
+
+    def _write_block(self, records: List[ChunkRecord], embed_pool: ThreadPoolExecutor) -> int:
+        """Embed a block's chunks in bounded batches and upsert them"""
+        return embed_and_upsert(
+            self.vector_store, self.embeddings, records, embed_pool, self.embed_batch_size
+        )
+
+    def _report(self, checkpoint: IngestionCheckpoint, started_at: float, rows_this_run: int):
+        """Log and forward progress"""
+        elapsed = time.monotonic() - started_at
+        progress = {
+            "rows_done": checkpoint.rows_done,
+            "chunks_written": checkpoint.chunks_written,
+            "rows_per_second": rows_this_run / elapsed if elapsed > 0 else 0.0
+        }
+        logger.info(
+            f"Ingested {progress['rows_done']} rows / {progress['chunks_written']} chunks "
+            f"({progress['rows_per_second']:.1f} rows/s)"
+        )
+        if self.progress_callback:
+            self.progress_callback(progress)
+
+    def ingest(self, csv_path: str) -> IngestionCheckpoint:
+        """Ingest a CSV, resuming from the last checkpoint if there is one"""
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"Knowledge base CSV not found: {csv_path}")
+
+        checkpoint = IngestionCheckpoint.load(
+            os.path.join(self.persist_directory, CHECKPOINT_FILENAME),
+            file_fingerprint(csv_path)
+        )
+        if checkpoint.completed:
+            logger.info("Checkpoint says ingestion already completed, nothing to do")
+            return checkpoint
+
+        if checkpoint.rows_done:
+            logger.info(f"Resuming ingestion from row {checkpoint.rows_done}")
+
+        reader = pd.read_csv(
+            csv_path,
+            chunksize=self.rows_per_block,
+            skiprows=range(1, checkpoint.rows_done + 1)
+        )
+
+        started_at = time.monotonic()
+        rows_this_run = 0
+        next_index = checkpoint.rows_done
+        inflight = deque()
+
+        with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=PARSE_POOL_CONTEXT) as parse_pool, \
+                ThreadPoolExecutor(max_workers=self.embed_concurrency) as embed_pool:
+
+            def drain_oldest():
+                nonlocal rows_this_run
+                future, row_count = inflight.popleft()
+                checkpoint.chunks_written += self._write_block(future.result(), embed_pool)
+                # Blocks are written in order, so rows_done is always a safe resume point
+                checkpoint.rows_done += row_count
+                rows_this_run += row_count
+                checkpoint.save()
+                self._report(checkpoint, started_at, rows_this_run)
+
+            for frame in reader:
+                rows = frame.to_dict("records")
+                inflight.append((
+                    parse_pool.submit(_split_rows, rows, next_index, self.chunk_size, self.chunk_overlap),
+                    len(rows)
+                ))
+                next_index += len(rows)
+
+                if len(inflight) >= self.max_inflight_blocks:
+                    drain_oldest()
+
+            while inflight:
+                drain_oldest()
+
+        checkpoint.completed = True
+        checkpoint.save()
+        logger.info(f"Ingestion complete: {checkpoint.rows_done} rows, {checkpoint.chunks_written} chunks")
+        return checkpoint
+
+
+if __name__ == "__main__":
+    import argparse
+    from knowledge_base import KnowledgeBaseLoader
+
+    parser = argparse.ArgumentParser(description="Stream a knowledge base CSV into the vector store")
+    parser.add_argument("csv_path", nargs="?", default="data/it_knowledge.csv")
+    parser.add_argument("--persist-directory", default="./chroma_db")
+    parser.add_argument("--collection-name", default="it_helpdesk")
+    args = parser.parse_args()
+
+    loader = KnowledgeBaseLoader(
+        csv_path=args.csv_path,
+        persist_directory=args.persist_directory,
+        collection_name=args.collection_name,
+        streaming=True
+    )
+    loader.initialize()
@@ -3,11 +3,13 @@ Knowledge base loader and vector store initialization
 """
 import os
 import pandas as pd
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 from langchain.docstore.document import Document
+from ingestion import CHECKPOINT_FILENAME, StreamingCSVIngestor, build_csv_document, has_incomplete_checkpoint
+from document_ingestion import MANIFEST_FILENAME, DirectoryIngestor
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -21,11 +23,17 @@ class KnowledgeBaseLoader:
         self,
         csv_path: str = "data/it_knowledge.csv",
         persist_directory: str = "./chroma_db",
-        collection_name: str = "it_helpdesk"
+        collection_name: str = "it_helpdesk",
+        streaming: bool = False,
+        ingest_options: Optional[Dict] = None,
+        docs_directory: Optional[str] = None
     ):
         self.csv_path = csv_path
+        self.docs_directory = docs_directory
         self.persist_directory = persist_directory
         self.collection_name = collection_name
+        self.streaming = streaming
+        self.ingest_options = ingest_options or {}
         self.embeddings = OpenAIEmbeddings()
         self.vector_store = None
         
@@ -39,30 +47,8 @@ class KnowledgeBaseLoader:
         df = pd.read_csv(self.csv_path)
         documents = []
         
-        for idx, row in df.iterrows():
-            # Create comprehensive document content
-            content = f"""Category: {row['category']}
-Issue: {row['issue']}
-Priority: {row['priority']}
-
-Solution:
-{row['solution']}
-
-Keywords: {row['keywords']}
-"""
-            
-            # Create metadata for filtering and source attribution
-            metadata = {
-                "category": row['category'],
-                "issue": row['issue'],
-                "priority": row['priority'],
-                "keywords": row['keywords'],
-                "source": f"IT Knowledge Base - {row['category'].title()}",
-                "doc_id": idx
-            }
-            
-            doc = Document(page_content=content, metadata=metadata)
-            documents.append(doc)
+        for idx, row in enumerate(df.to_dict("records")):
+            documents.append(build_csv_document(row, idx))
         
         logger.info(f"Loaded {len(documents)} documents from knowledge base")
         return documents
@@ -92,6 +78,34 @@ Keywords: {row['keywords']}
         logger.info(f"Vector store created with {len(split_docs)} chunks")
         return vector_store
     
+    def ingest_streaming(self) -> Chroma:
+        """Stream the CSV into the vector store in bounded, resumable blocks"""
+        logger.info("Streaming knowledge base into vector store...")
+        
+        vector_store = self.load_existing_store()
+        ingestor = StreamingCSVIngestor(
+            vector_store=vector_store,
+            embeddings=self.embeddings,
+            persist_directory=self.persist_directory,
+            **self.ingest_options
+        )
+        ingestor.ingest(self.csv_path)
+        
+        return vector_store
+    
+    def ingest_documents(self) -> Dict[str, int]:
+        """Sync Markdown/HTML/text runbooks from docs_directory into the vector store"""
+        logger.info(f"Syncing documents from {self.docs_directory}")
+        
+        ingestor = DirectoryIngestor(
+            vector_store=self.vector_store,
+            embeddings=self.embeddings,
+            persist_directory=self.persist_directory,
+            embed_batch_size=self.ingest_options.get("embed_batch_size", 256),
+            embed_concurrency=self.ingest_options.get("embed_concurrency", 4)
+        )
+        return ingestor.ingest(self.docs_directory)
+    
     def load_existing_store(self) -> Chroma:
         """Load existing vector store"""
         logger.info("Loading existing vector store...")
@@ -104,19 +118,43 @@ Keywords: {row['keywords']}
         
         return vector_store
     
+    def reset_store(self):
+        """Drop the collection and ingestion progress so the next ingest starts from scratch"""
+        logger.info("Resetting existing vector store...")
+        self.load_existing_store().delete_collection()
+        for filename in (CHECKPOINT_FILENAME, MANIFEST_FILENAME):
+            path = os.path.join(self.persist_directory, filename)
+            if os.path.exists(path):
+                os.remove(path)
+    
     def initialize(self, force_reload: bool = False) -> Chroma:
         """Initialize vector store (load existing or create new)"""
         # Check if vector store already exists
         store_exists = os.path.exists(self.persist_directory)
         
-        if store_exists and not force_reload:
+        # Upserting over the old collection would keep chunks of deleted rows
+        # (and a completed checkpoint would skip ingestion entirely)
+        if store_exists and force_reload:
+            self.reset_store()
+        
+        if has_incomplete_checkpoint(self.persist_directory) and not force_reload:
+            logger.info("Previous ingestion was interrupted, resuming...")
+            self.vector_store = self.ingest_streaming()
+        elif store_exists and not force_reload:
             logger.info("Vector store exists, loading...")
             self.vector_store = self.load_existing_store()
+        elif self.streaming:
+            logger.info("Creating new vector store (streaming)...")
+            self.vector_store = self.ingest_streaming()
         else:
             logger.info("Creating new vector store...")
             documents = self.load_csv()
             self.vector_store = self.create_vector_store(documents)
         
+        # Runbook directories are synced incrementally on every start
+        if self.docs_directory:
+            self.ingest_documents()
+        
         return self.vector_store
     
     def search(self, query: str, k: int = 3) -> List[Dict]:
@@ -201,6 +239,14 @@ def get_quick_actions() -> List[Dict]:
     ]
 
 
+def get_quick_action_category(action_id: str) -> Optional[str]:
+    """Get the knowledge base category a quick action is scoped to"""
+    for action in get_quick_actions():
+        if action["id"] == action_id:
+            return action["category"]
+    return None
+
+
 if __name__ == "__main__":
     # Test knowledge base loader
     loader = KnowledgeBaseLoader()
@@ -1,24 +1,37 @@
 """
 FastAPI backend for IT Helpdesk Chatbot
 """
-from fastapi import FastAPI, HTTPException, status
+from fastapi import FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, nullcontext
 import os
+import asyncio
+import time
 import logging
 from datetime import datetime
-from typing import Dict
-import uuid
+from typing import Dict, Optional
 
 from dotenv import load_dotenv
+from pydantic import ValidationError
 
 from models import (
-    ChatRequest, ChatResponse, TicketRequest, TicketResponse,
-    HealthResponse, QuickAction, AnalyticsEvent
+    ChatRequest, ChatResponse, PrefetchRequest, PrefetchResponse, TicketRequest, TicketResponse, TicketRecord,
+    TicketStatusUpdate, HealthResponse, QuickAction, AnalyticsEvent, AnalyticsBatch
 )
-from knowledge_base import KnowledgeBaseLoader, get_quick_actions
+from knowledge_base import KnowledgeBaseLoader, get_quick_actions, get_quick_action_category
 from chat_engine import ITHelpdeskChatEngine, get_quick_action_message
+from retrieval import ConfidenceCalibration
+from reranker import ConfidenceGatedReranker
+from analytics_store import AnalyticsStore, AnalyticsPipeline, TIME_BUCKETS
+from ticket_store import TicketStore, TICKET_STATUSES
+from index_manager import IndexManager
+from tenants import TenantPool, UnknownTenantError, create_default_runtime, load_tenant_configs
+from profiling import RequestProfiler
+from traffic_capture import TrafficRecorder
+from stub_llm import StubChatModel
+from prefetch import RetrievalCache, PrefetchScheduler, normalize_query
 
 # Load environment variables
 load_dotenv()
@@ -33,12 +46,82 @@ logger = logging.getLogger(__name__)
 # Global variables for chat engine and knowledge base
 chat_engine: ITHelpdeskChatEngine = None
 kb_loader: KnowledgeBaseLoader = None
+index_manager: IndexManager = None
+reranker: Optional[ConfidenceGatedReranker] = None
+tenant_pool: TenantPool = None
+request_profiler: Optional[RequestProfiler] = None
+traffic_recorder: Optional[TrafficRecorder] = None
+retrieval_cache: Optional[RetrievalCache] = None
+prefetch_scheduler: Optional[PrefetchScheduler] = None
+analytics_pipeline: AnalyticsPipeline = None
+ticket_store: TicketStore = None
+background_tasks: set = set()
+
+
+def create_kb_loader(
+    persist_directory: str,
+    tenant_config: Optional[Dict] = None
+) -> KnowledgeBaseLoader:
+    """Create a knowledge base loader for an index directory (tenant settings override the environment)"""
+    tenant_config = tenant_config or {}
+    return KnowledgeBaseLoader(
+        csv_path=tenant_config.get("csv_path", os.getenv("KB_CSV_PATH", "data/it_knowledge.csv")),
+        persist_directory=persist_directory,
+        collection_name=tenant_config.get("collection_name", os.getenv("COLLECTION_NAME", "it_helpdesk")),
+        streaming=os.getenv("KB_STREAMING_INGEST", "false").lower() == "true",
+        ingest_options={
+            "rows_per_block": int(os.getenv("KB_INGEST_ROWS_PER_BLOCK", "1000")),
+            "embed_batch_size": int(os.getenv("KB_INGEST_EMBED_BATCH_SIZE", "256")),
+            "embed_concurrency": int(os.getenv("KB_INGEST_EMBED_CONCURRENCY", "4"))
+        },
+        docs_directory=tenant_config.get("docs_directory", os.getenv("KB_DOCS_DIR") or None)
+    )
+
+
+def create_chat_engine(
+    vector_store,
+    tenant_config: Optional[Dict] = None
+) -> ITHelpdeskChatEngine:
+    """Create a chat engine from the environment (tenant settings override the prompt)"""
+    tenant_config = tenant_config or {}
+    
+    # Fixed confidence parameters override the per-index calibration
+    confidence_calibration = None
+    if os.getenv("CONFIDENCE_MIDPOINT"):
+        confidence_calibration = ConfidenceCalibration(
+            midpoint=float(os.getenv("CONFIDENCE_MIDPOINT")),
+            slope=float(os.getenv("CONFIDENCE_SLOPE", "12")),
+            source="configured"
+        )
+    
+    # Replays and load tests swap in a canned model so only our own code is measured
+    llm = None
+    if os.getenv("LLM_STUB", "false").lower() == "true":
+        llm = StubChatModel(latency_ms=float(os.getenv("LLM_STUB_LATENCY_MS", "0")))
+    
+    return ITHelpdeskChatEngine(
+        vector_store=vector_store,
+        model_name=os.getenv("MODEL_NAME", "gpt-4o-mini"),
+        temperature=float(os.getenv("TEMPERATURE", "0.7")),
+        max_tokens=int(os.getenv("MAX_TOKENS", "500")),
+        retrieval_k=int(os.getenv("RETRIEVAL_K", "3")),
+        min_filtered_relevance=float(os.getenv("MIN_FILTERED_RELEVANCE", "0.3")),
+        reranker=reranker,
+        adaptive_retrieval=os.getenv("ADAPTIVE_RETRIEVAL", "true").lower() == "true",
+        escalation_confidence=float(os.getenv("ESCALATION_CONFIDENCE", "0.35")),
+        prompt_preamble=tenant_config.get("prompt_preamble"),
+        llm=llm,
+        retrieval_cache=retrieval_cache,
+        confidence_calibration=confidence_calibration,
+        adaptive_low_confidence=float(os.getenv("ADAPTIVE_LOW_CONFIDENCE", "0.4"))
+    )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Initialize services on startup"""
-    global chat_engine, kb_loader
+    global chat_engine, kb_loader, index_manager, reranker, tenant_pool, analytics_pipeline, ticket_store
+    global request_profiler, traffic_recorder, retrieval_cache, prefetch_scheduler
     
     logger.info("Starting IT Helpdesk Chatbot API...")
     
@@ -47,23 +130,97 @@ async def lifespan(app: FastAPI):
         logger.error("OPENAI_API_KEY not set in environment variables!")
         raise ValueError("OPENAI_API_KEY must be set")
     
-    # Initialize knowledge base
+    # Initialize knowledge base (versioned, so it can be rebuilt while serving)
     logger.info("Initializing knowledge base...")
-    kb_loader = KnowledgeBaseLoader(
-        csv_path=os.getenv("KB_CSV_PATH", "data/it_knowledge.csv"),
-        persist_directory=os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db"),
-        collection_name=os.getenv("COLLECTION_NAME", "it_helpdesk")
-    )
-    vector_store = kb_loader.initialize()
+    kb_loader = create_kb_loader(os.getenv("CHROMA_PERSIST_DIRECTORY", "./chroma_db"))
+    index_options = {"calibration_samples": int(os.getenv("CONFIDENCE_CALIBRATION_SAMPLES", "50"))}
+    index_manager = IndexManager(kb_loader=kb_loader, loader_factory=create_kb_loader, **index_options)
+    vector_store = index_manager.initialize().vector_store
+    
+    # Optional cross-encoder re-ranker (loaded once, CPU only, shared by all tenants)
+    if os.getenv("RERANK_ENABLED", "false").lower() == "true":
+        logger.info("Initializing re-ranker...")
+        reranker = ConfidenceGatedReranker(
+            model_name=os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"),
+            ambiguity_margin=float(os.getenv("RERANK_AMBIGUITY_MARGIN", "0.05")),
+            confident_margin=float(os.getenv("RERANK_CONFIDENT_MARGIN", "0.15"))
+        )
+        if not reranker.load():
+            reranker = None
+    
+    # Retrieval results warmed by /prefetch, shared by all tenants (entries are
+    # tied to the index they came from)
+    if os.getenv("PREFETCH_ENABLED", "true").lower() == "true":
+        retrieval_cache = RetrievalCache(
+            ttl_seconds=float(os.getenv("PREFETCH_CACHE_TTL", "60")),
+            max_entries=int(os.getenv("PREFETCH_CACHE_SIZE", "2000"))
+        )
+        prefetch_scheduler = PrefetchScheduler(
+            min_interval=float(os.getenv("PREFETCH_MIN_INTERVAL", "0.3")),
+            max_concurrent=int(os.getenv("PREFETCH_MAX_CONCURRENT", "2"))
+        )
     
     # Initialize chat engine
     logger.info("Initializing chat engine...")
-    chat_engine = ITHelpdeskChatEngine(
-        vector_store=vector_store,
-        model_name=os.getenv("MODEL_NAME", "gpt-4o-mini"),
-        temperature=float(os.getenv("TEMPERATURE", "0.7")),
-        max_tokens=int(os.getenv("MAX_TOKENS", "500"))
+    chat_engine = create_chat_engine(vector_store)
+    
+    # Swapping an index version repoints the chat engine as well
+    index_manager.on_swap = lambda version: chat_engine.set_vector_store(version.vector_store)
+    
+    # Additional tenants load lazily and share a memory budget
+    tenant_pool = TenantPool(
+        default_runtime=create_default_runtime(chat_engine, index_manager),
+        configs=load_tenant_configs(os.getenv("TENANTS_CONFIG")),
+        loader_factory=create_kb_loader,
+        engine_factory=create_chat_engine,
+        memory_budget_bytes=int(os.getenv("TENANT_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024,
+        index_options=index_options
+    )
+    
+    kb_watcher = None
+    watch_interval = float(os.getenv("KB_WATCH_INTERVAL", "0"))
+    if watch_interval > 0:
+        logger.info(f"Watching knowledge base sources every {watch_interval}s")
+        kb_watcher = asyncio.create_task(index_manager.watch(watch_interval))
+    
+    # Initialize analytics pipeline
+    logger.info("Initializing analytics pipeline...")
+    analytics_pipeline = AnalyticsPipeline(
+        store=AnalyticsStore(db_path=os.getenv("ANALYTICS_DB_PATH", "./analytics.db")),
+        max_queue_size=int(os.getenv("ANALYTICS_QUEUE_SIZE", "10000")),
+        batch_size=int(os.getenv("ANALYTICS_BATCH_SIZE", "500")),
+        flush_interval=float(os.getenv("ANALYTICS_FLUSH_INTERVAL", "2.0"))
     )
+    analytics_pipeline.start()
+    
+    # Initialize ticket store (reuses the KB embeddings for duplicate detection)
+    logger.info("Initializing ticket store...")
+    ticket_store = TicketStore(
+        db_path=os.getenv("TICKET_DB_PATH", "./tickets.db"),
+        embed_fn=kb_loader.embeddings.embed_query,
+        duplicate_window_minutes=int(os.getenv("TICKET_DUPLICATE_WINDOW_MINUTES", "30")),
+        duplicate_threshold=float(os.getenv("TICKET_DUPLICATE_THRESHOLD", "0.9"))
+    )
+    
+    # Opt-in request profiling; left as None (no per-request cost) unless configured
+    profile_sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+    profile_token = os.getenv("PROFILE_TOKEN") or None
+    if profile_sample_rate > 0 or profile_token:
+        request_profiler = RequestProfiler(
+            output_dir=os.getenv("PROFILE_DIR", "./profiles"),
+            sample_rate=profile_sample_rate,
+            token=profile_token,
+            max_files=int(os.getenv("PROFILE_MAX_FILES", "200"))
+        )
+        logger.info(f"Request profiling enabled (sample rate {profile_sample_rate}, output {request_profiler.output_dir})")
+    
+    # Opt-in traffic capture for offline replay (see replay.py)
+    capture_path = os.getenv("TRAFFIC_CAPTURE_PATH")
+    if capture_path:
+        traffic_recorder = TrafficRecorder(capture_path)
+    
+    if os.getenv("LLM_STUB", "false").lower() == "true":
+        logger.warning("LLM_STUB is enabled: answers are canned, not generated")
     
     logger.info("✅ IT Helpdesk Chatbot API started successfully!")
     
@@ -71,6 +228,12 @@ async def lifespan(app: FastAPI):
     
     # Cleanup
     logger.info("Shutting down IT Helpdesk Chatbot API...")
+    if kb_watcher:
+        kb_watcher.cancel()
+    await analytics_pipeline.stop()
+    ticket_store.close()
+    if traffic_recorder:
+        traffic_recorder.close()
 
 
 # Create FastAPI app
@@ -114,13 +277,16 @@ async def health_check():
             "api": "healthy",
             "chat_engine": "healthy" if chat_engine else "unavailable",
             "knowledge_base": "healthy" if kb_loader else "unavailable",
-            "vector_store": "healthy" if kb_loader and kb_loader.vector_store else "unavailable"
+            "vector_store": "healthy" if kb_loader and kb_loader.vector_store else "unavailable",
+            "index_version": index_manager.current.version_id if index_manager and index_manager.current else "unavailable",
+            "analytics": "healthy" if analytics_pipeline else "unavailable",
+            "ticket_store": "healthy" if ticket_store else "unavailable"
         }
     )
 
 
 @app.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, http_request: Request, response: Response):
     """
     Main chat endpoint for processing user queries
     """
@@ -133,24 +299,63 @@ async def chat(request: ChatRequest):
         
         logger.info(f"Received chat request: {request.message[:50]}...")
         
-        # Process message
-        response, conv_id, sources, should_escalate, suggested_actions = chat_engine.chat(
-            user_message=request.message,
-            conversation_id=request.conversation_id,
-            user_context=request.user_context
-        )
+        arrived_at = traffic_recorder.arrival() if traffic_recorder else None
+        started = time.perf_counter()
+        
+        profile_context = nullcontext()
+        if request_profiler and request_profiler.should_profile(http_request.headers):
+            profile_context = request_profiler.profile("chat")
+        
+        # Loading a tenant's index can take a while; keep it off the event loop
+        await asyncio.to_thread(tenant_pool.ensure_loaded, request.tenant_id)
+        
+        # Process message with the tenant's engine against a pinned index version
+        with tenant_pool.acquire(request.tenant_id) as (engine, index), profile_context as profile:
+            answer, conv_id, sources, should_escalate, suggested_actions, confidence, category = engine.chat(
+                user_message=request.message,
+                conversation_id=request.conversation_id,
+                user_context=request.user_context,
+                vector_store=index.vector_store
+            )
+        
+        if profile:
+            response.headers.update(profile.headers)
+        # The version this answer was actually served from (not whatever is current now)
+        response.headers["X-KB-Index-Version"] = index.version_id
         
         # Log analytics
         logger.info(f"Response generated for conversation {conv_id}")
         
+        if traffic_recorder:
+            traffic_recorder.record(
+                endpoint="chat",
+                arrived_at=arrived_at,
+                request_conversation_id=request.conversation_id,
+                response_conversation_id=conv_id,
+                message=request.message,
+                user_context=request.user_context,
+                tenant_id=request.tenant_id,
+                duration_ms=(time.perf_counter() - started) * 1000
+            )
+        
         return ChatResponse(
-            response=response,
+            response=answer,
             conversation_id=conv_id,
             sources=sources,
+            confidence=confidence,
             suggested_actions=suggested_actions,
-            should_escalate=should_escalate
+            should_escalate=should_escalate,
+            index_version=index.version_id,
+            category=category
         )
     
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tenant '{request.tenant_id}' not found"
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error processing chat request: {str(e)}", exc_info=True)
         raise HTTPException(
@@ -159,6 +364,52 @@ async def chat(request: ChatRequest):
         )
 
 
+@app.post("/prefetch", response_model=PrefetchResponse, status_code=status.HTTP_202_ACCEPTED)
+async def prefetch(request: PrefetchRequest):
+    """
+    Warm retrieval for a message the user is still typing (call debounced)
+    """
+    # Rate limiting and staleness are per conversation, or per browser tab
+    # (draft_id) before the first answer assigns one
+    conversation_key = request.conversation_id or request.draft_id
+    if not prefetch_scheduler or not tenant_pool or not conversation_key:
+        return PrefetchResponse(status="skipped")
+    
+    text_key = normalize_query(request.text)
+    if len(text_key) < int(os.getenv("PREFETCH_MIN_CHARS", "12")):
+        return PrefetchResponse(status="skipped")
+    
+    try:
+        engine = tenant_pool.get_engine(request.tenant_id)
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tenant '{request.tenant_id}' not found"
+        )
+    
+    # Later turns are rephrased before retrieval, so there is nothing to warm;
+    # prefetch never loads an unloaded (or evicted) tenant index
+    if engine is None or engine.vector_store is None or (request.conversation_id and engine.get_message_count(request.conversation_id) > 0):
+        return PrefetchResponse(status="skipped")
+    
+    def warm(is_stale):
+        # The tenant may have been evicted since the check above
+        with tenant_pool.acquire_if_loaded(request.tenant_id) as pinned:
+            if pinned is None:
+                return
+            tenant_engine, index = pinned
+            tenant_engine.prefetch(
+                request.text,
+                conversation_id=request.conversation_id,
+                user_context=request.user_context,
+                vector_store=index.vector_store,
+                is_stale=is_stale
+            )
+    
+    result = prefetch_scheduler.submit(f"{request.tenant_id}:{conversation_key}", text_key, warm)
+    return PrefetchResponse(status=result)
+
+
 @app.get("/quick-actions", response_model=list[QuickAction])
 async def get_quick_action_buttons():
     """
@@ -177,7 +428,12 @@ async def get_quick_action_buttons():
 
 
 @app.post("/quick-action/{action_id}", response_model=ChatResponse)
-async def process_quick_action(action_id: str, conversation_id: str = None):
+async def process_quick_action(
+    action_id: str,
+    response: Response,
+    conversation_id: str = None,
+    tenant_id: Optional[str] = None
+):
     """
     Process a quick action button click
     """
@@ -191,20 +447,50 @@ async def process_quick_action(action_id: str, conversation_id: str = None):
                 detail=f"Quick action '{action_id}' not found"
             )
         
-        # Process as regular chat message
-        response, conv_id, sources, should_escalate, suggested_actions = chat_engine.chat(
-            user_message=message,
-            conversation_id=conversation_id
-        )
+        arrived_at = traffic_recorder.arrival() if traffic_recorder else None
+        started = time.perf_counter()
+        
+        # Loading a tenant's index can take a while; keep it off the event loop
+        await asyncio.to_thread(tenant_pool.ensure_loaded, tenant_id)
+        
+        # Process as regular chat message, scoped to the action's category
+        with tenant_pool.acquire(tenant_id) as (engine, index):
+            answer, conv_id, sources, should_escalate, suggested_actions, confidence, category = engine.chat(
+                user_message=message,
+                conversation_id=conversation_id,
+                category=get_quick_action_category(action_id),
+                vector_store=index.vector_store
+            )
+        
+        if traffic_recorder:
+            traffic_recorder.record(
+                endpoint="quick_action",
+                arrived_at=arrived_at,
+                request_conversation_id=conversation_id,
+                response_conversation_id=conv_id,
+                action_id=action_id,
+                tenant_id=tenant_id,
+                duration_ms=(time.perf_counter() - started) * 1000
+            )
+        
+        response.headers["X-KB-Index-Version"] = index.version_id
         
         return ChatResponse(
-            response=response,
+            response=answer,
             conversation_id=conv_id,
             sources=sources,
+            confidence=confidence,
             suggested_actions=suggested_actions,
-            should_escalate=should_escalate
+            should_escalate=should_escalate,
+            index_version=index.version_id,
+            category=category
         )
     
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tenant '{tenant_id}' not found"
+        )
     except HTTPException:
         raise
     except Exception as e:
@@ -221,10 +507,25 @@ async def create_ticket(ticket: TicketRequest):
     Create a support ticket for escalated issues
     """
     try:
-        # In production, this would integrate with ServiceNow, Jira, etc.
-        # For now, we'll simulate ticket creation
+        if not ticket_store:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Ticket store not initialized"
+            )
         
-        ticket_id = f"TKT-{str(uuid.uuid4())[:8].upper()}"
+        # conversation_id doubles as the idempotency key, so retries and
+        # double-submits return the ticket that already exists
+        record = await asyncio.to_thread(
+            ticket_store.create,
+            issue_description=ticket.issue_description,
+            category=ticket.category,
+            priority=ticket.priority,
+            user_email=ticket.user_email,
+            user_name=ticket.user_name,
+            conversation_id=ticket.conversation_id
+        )
+        ticket_id = record["ticket_id"]
+        is_duplicate = record["incident_id"] != ticket_id
         
         # Determine estimated response time based on priority
         response_times = {
@@ -234,21 +535,37 @@ async def create_ticket(ticket: TicketRequest):
             "critical": "1 hour"
         }
         
-        estimated_time = response_times.get(ticket.priority.lower(), "1 business day")
+        estimated_time = response_times.get(record["priority"], "1 business day")
         
-        # Log ticket creation (in production, save to database)
-        logger.info(f"Created ticket {ticket_id}: {ticket.issue_description[:50]}...")
-        logger.info(f"Category: {ticket.category}, Priority: {ticket.priority}")
+        if record["created"]:
+            logger.info(f"Created ticket {ticket_id}: {ticket.issue_description[:50]}...")
+            logger.info(f"Category: {ticket.category}, Priority: {ticket.priority}, Incident: {record['incident_id']}")
+        else:
+            logger.info(f"Returning existing ticket {ticket_id} for conversation {ticket.conversation_id}")
+        
+        message = (
+            f"Your support ticket {ticket_id} has been created. "
+            if record["created"] else
+            f"A support ticket {ticket_id} already exists for this conversation. "
+        )
+        if is_duplicate:
+            message += f"It has been linked to ongoing incident {record['incident_id']}. "
+        message += (
+            f"IT support will respond within {estimated_time}. "
+            f"You'll receive updates at {record['user_email'] or 'your email'}."
+        )
         
         return TicketResponse(
             ticket_id=ticket_id,
-            status="created",
+            status="created" if record["created"] else "existing",
             estimated_response_time=estimated_time,
-            message=f"Your support ticket {ticket_id} has been created. "
-                   f"IT support will respond within {estimated_time}. "
-                   f"You'll receive updates at {ticket.user_email or 'your email'}."
+            message=message,
+            incident_id=record["incident_id"],
+            is_duplicate=is_duplicate
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error creating ticket: {str(e)}")
         raise HTTPException(
@@ -257,25 +574,135 @@ async def create_ticket(ticket: TicketRequest):
         )
 
 
+@app.get("/tickets", response_model=list[TicketRecord])
+async def list_tickets(
+    status_filter: Optional[str] = Query(None, alias="status"),
+    category: Optional[str] = None,
+    priority: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    List tickets filtered by status, category and priority (admin only)
+    """
+    verify_admin_token(x_admin_token)
+    
+    if not ticket_store:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ticket store not initialized"
+        )
+    
+    try:
+        tickets = await asyncio.to_thread(
+            ticket_store.list_tickets,
+            status=status_filter,
+            category=category,
+            priority=priority.lower() if priority else None,
+            limit=limit
+        )
+        return [TicketRecord(**t) for t in tickets]
+    
+    except Exception as e:
+        logger.error(f"Error listing tickets: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error listing tickets: {str(e)}"
+        )
+
+
+@app.get("/ticket/{ticket_id}", response_model=TicketRecord)
+async def get_ticket(ticket_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    Get a single ticket (admin only)
+    """
+    verify_admin_token(x_admin_token)
+    
+    if not ticket_store:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ticket store not initialized"
+        )
+    
+    record = await asyncio.to_thread(ticket_store.get, ticket_id)
+    if not record:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Ticket '{ticket_id}' not found"
+        )
+    
+    return TicketRecord(**record)
+
+
+@app.patch("/ticket/{ticket_id}/status", response_model=TicketRecord)
+async def update_ticket_status(
+    ticket_id: str,
+    update: TicketStatusUpdate,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Move a ticket through its lifecycle (admin only); resolved and closed
+    tickets no longer attract duplicates
+    """
+    verify_admin_token(x_admin_token)
+    
+    if not ticket_store:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ticket store not initialized"
+        )
+    
+    if update.status not in TICKET_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"status must be one of {list(TICKET_STATUSES)}"
+        )
+    
+    updated = await asyncio.to_thread(ticket_store.update_status, ticket_id, update.status)
+    if not updated:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Ticket '{ticket_id}' not found"
+        )
+    
+    logger.info(f"Ticket {ticket_id} moved to {update.status}")
+    return TicketRecord(**await asyncio.to_thread(ticket_store.get, ticket_id))
+
+
+def get_tenant_engine(tenant_id: Optional[str]) -> Optional[ITHelpdeskChatEngine]:
+    """Resolve a tenant's chat engine without loading its index (None if it has no conversations yet)"""
+    if not tenant_pool:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Chat engine not initialized"
+        )
+    
+    try:
+        return tenant_pool.get_engine(tenant_id)
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tenant '{tenant_id}' not found"
+        )
+
+
 @app.delete("/conversation/{conversation_id}")
-async def clear_conversation(conversation_id: str):
+async def clear_conversation(conversation_id: str, tenant_id: Optional[str] = None):
     """
     Clear conversation history
     """
     try:
-        if not chat_engine:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Chat engine not initialized"
-            )
+        engine = get_tenant_engine(tenant_id)
         
-        cleared = chat_engine.clear_conversation(conversation_id)
+        cleared = engine.clear_conversation(conversation_id) if engine else False
         
         if cleared:
             return {"message": f"Conversation {conversation_id} cleared successfully"}
         else:
             return {"message": f"Conversation {conversation_id} not found or already cleared"}
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error clearing conversation: {str(e)}")
         raise HTTPException(
@@ -285,25 +712,61 @@ async def clear_conversation(conversation_id: str):
 
 
 @app.get("/conversation/{conversation_id}/history")
-async def get_conversation_history(conversation_id: str):
+async def get_conversation_history(
+    conversation_id: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    before: Optional[int] = Query(None, ge=0, description="Only messages before this index"),
+    after: Optional[int] = Query(None, ge=-1, description="Only messages after this index (since mode)"),
+    tenant_id: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     """
-    Get conversation history
+    Get conversation history with cursor pagination and ETag revalidation
     """
     try:
-        if not chat_engine:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Chat engine not initialized"
-            )
+        engine = get_tenant_engine(tenant_id)
+        if engine is None:
+            # Tenant has not chatted since this process started
+            return {
+                "conversation_id": conversation_id,
+                "message_count": 0,
+                "messages": [],
+                "first_index": None,
+                "last_index": None,
+                "has_more_before": False,
+                "has_more_after": False
+            }
         
-        history = chat_engine.get_conversation_history(conversation_id)
+        # The version only depends on the conversation state, so unchanged
+        # histories are answered before anything is serialized
+        version = engine.get_history_version(conversation_id)
+        etag = f'"{version}"'
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        
+        history = engine.get_conversation_history(
+            conversation_id,
+            after=after,
+            before=before,
+            limit=limit
+        )
+        total = engine.get_message_count(conversation_id)
+        
+        response.headers["ETag"] = etag
         
         return {
             "conversation_id": conversation_id,
-            "message_count": len(history),
-            "messages": history
+            "message_count": total,
+            "messages": history,
+            "first_index": history[0]["index"] if history else None,
+            "last_index": history[-1]["index"] if history else None,
+            "has_more_before": bool(history) and history[0]["index"] > 0,
+            "has_more_after": bool(history) and history[-1]["index"] < total - 1
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching conversation history: {str(e)}")
         raise HTTPException(
@@ -318,11 +781,13 @@ async def log_analytics(event: AnalyticsEvent):
     Log analytics event (for tracking usage, satisfaction, etc.)
     """
     try:
-        # In production, this would save to analytics database
-        logger.info(f"Analytics event: {event.event_type}")
-        logger.debug(f"Event details: {event.model_dump()}")
+        # Enqueue only; the background writer persists events in batches
+        if not analytics_pipeline or not analytics_pipeline.enqueue(event.model_dump()):
+            return {"message": "Analytics event dropped", "accepted": 0}
+        
+        logger.debug(f"Analytics event queued: {event.event_type}")
         
-        return {"message": "Analytics event logged successfully"}
+        return {"message": "Analytics event logged successfully", "accepted": 1}
     
     except Exception as e:
         logger.error(f"Error logging analytics: {str(e)}")
@@ -330,6 +795,208 @@ async def log_analytics(event: AnalyticsEvent):
         return {"message": "Analytics logging failed", "error": str(e)}
 
 
+@app.post("/analytics/batch")
+async def log_analytics_batch(http_request: Request):
+    """
+    Log a batch of analytics events in one request
+    """
+    # Parsed by hand so the text/plain bodies navigator.sendBeacon sends on
+    # page unload (JSON would need a CORS preflight) are accepted too
+    try:
+        batch = AnalyticsBatch.model_validate_json(await http_request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    
+    try:
+        accepted = 0
+        if analytics_pipeline:
+            accepted = analytics_pipeline.enqueue_many(
+                [event.model_dump() for event in batch.events]
+            )
+        
+        logger.debug(f"Analytics batch queued: {accepted}/{len(batch.events)} events")
+        
+        return {
+            "message": "Analytics batch logged successfully",
+            "accepted": accepted,
+            "dropped": len(batch.events) - accepted
+        }
+    
+    except Exception as e:
+        logger.error(f"Error logging analytics batch: {str(e)}")
+        # Don't fail on analytics errors
+        return {"message": "Analytics logging failed", "error": str(e)}
+
+
+@app.get("/analytics/latency")
+async def get_latency_percentiles(percentile: float = 0.95):
+    """
+    Get response latency percentile per category
+    """
+    if not analytics_pipeline:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analytics not initialized"
+        )
+    
+    if not 0.0 < percentile <= 1.0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="percentile must be in (0, 1]"
+        )
+    
+    try:
+        results = await asyncio.to_thread(
+            analytics_pipeline.store.latency_percentile_by_category, percentile
+        )
+        return {"percentile": percentile, "categories": results}
+    
+    except Exception as e:
+        logger.error(f"Error querying latency analytics: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error querying latency analytics: {str(e)}"
+        )
+
+
+@app.get("/analytics/helpful-rate")
+async def get_helpful_rate(
+    bucket: str = "day",
+    since: Optional[str] = None,
+    until: Optional[str] = None
+):
+    """
+    Get helpful-feedback rate over time
+    """
+    if not analytics_pipeline:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analytics not initialized"
+        )
+    
+    if bucket not in TIME_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"bucket must be one of {list(TIME_BUCKETS)}"
+        )
+    
+    try:
+        results = await asyncio.to_thread(
+            analytics_pipeline.store.helpful_rate_over_time, bucket, since, until
+        )
+        return {"bucket": bucket, "series": results}
+    
+    except Exception as e:
+        logger.error(f"Error querying helpful-rate analytics: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error querying helpful-rate analytics: {str(e)}"
+        )
+
+
+def verify_admin_token(x_admin_token: Optional[str]):
+    """Reject admin calls unless ADMIN_TOKEN is configured and matches"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or x_admin_token != admin_token:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin token required"
+        )
+
+
+@app.post("/admin/reload-kb", status_code=status.HTTP_202_ACCEPTED)
+async def reload_knowledge_base(
+    tenant_id: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Rebuild a tenant's knowledge base index in the background and swap it in when ready
+    """
+    verify_admin_token(x_admin_token)
+    
+    if not tenant_pool:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Knowledge base not initialized"
+        )
+    
+    try:
+        manager = await asyncio.to_thread(tenant_pool.get_index_manager, tenant_id)
+    except UnknownTenantError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tenant '{tenant_id}' not found"
+        )
+    
+    if manager.building:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An index build is already in progress"
+        )
+    
+    async def run_reload():
+        try:
+            await manager.reload()
+        except Exception:
+            # Already logged by the index manager; the old version keeps serving
+            pass
+    
+    # Keep a reference so the task is not garbage-collected mid-build
+    task = asyncio.create_task(run_reload())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    
+    return {
+        "message": "Knowledge base rebuild started",
+        "current_version": manager.current.version_id
+    }
+
+
+@app.get("/admin/index-status")
+async def get_index_status(x_admin_token: Optional[str] = Header(None)):
+    """
+    Get the live index version, build state and versions still draining
+    """
+    verify_admin_token(x_admin_token)
+    
+    if not index_manager:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Knowledge base not initialized"
+        )
+    
+    return {**index_manager.status(), "tenants": tenant_pool.status()}
+
+
+@app.get("/admin/cache-stats")
+async def get_cache_stats(x_admin_token: Optional[str] = Header(None)):
+    """
+    Get hit/miss counters for the server-side caches (used by replay.py)
+    """
+    verify_admin_token(x_admin_token)
+    
+    if not tenant_pool:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Chat engine not initialized"
+        )
+    
+    tenants = tenant_pool.status()
+    return {
+        "tenant_index": {
+            "hits": tenants["hits"],
+            "misses": tenants["loads"],
+            "evictions": tenants["evictions"]
+        },
+        "retrieval": retrieval_cache.stats() if retrieval_cache else None,
+        "prefetch": prefetch_scheduler.stats() if prefetch_scheduler else None,
+        "traffic_capture": {
+            "enabled": traffic_recorder is not None,
+            "recorded": traffic_recorder.recorded if traffic_recorder else 0
+        }
+    }
+
+
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
@@ -21,6 +21,7 @@ class ChatRequest(BaseModel):
         default_factory=dict,
         description="Additional context (OS, location, etc.)"
     )
+    tenant_id: Optional[str] = Field(None, description="Helpdesk tenant (defaults to the primary knowledge base)")
 
 
 class ChatResponse(BaseModel):
@@ -34,6 +35,29 @@ class ChatResponse(BaseModel):
         description="Suggested follow-up actions"
     )
     should_escalate: bool = Field(False, description="Whether to escalate to human support")
+    index_version: Optional[str] = Field(None, description="Knowledge base index version used for this answer")
+    category: Optional[str] = Field(None, description="Knowledge base category of the top source")
+
+
+class PrefetchRequest(BaseModel):
+    """Request model for speculative retrieval while the user types"""
+    text: str = Field(..., min_length=1, max_length=2000, description="Partial message typed so far")
+    conversation_id: Optional[str] = Field(None, description="Conversation ID the message belongs to")
+    draft_id: Optional[str] = Field(
+        None,
+        max_length=64,
+        description="Client-generated ID of the chat tab, used until a conversation ID exists"
+    )
+    user_context: Optional[Dict[str, Any]] = Field(
+        default_factory=dict,
+        description="Same context that will be sent with the message"
+    )
+    tenant_id: Optional[str] = Field(None, description="Helpdesk tenant (defaults to the primary knowledge base)")
+
+
+class PrefetchResponse(BaseModel):
+    """Response model for prefetch endpoint"""
+    status: str = Field(..., description="scheduled, duplicate, rate_limited, busy or skipped")
 
 
 class TicketRequest(BaseModel):
@@ -52,6 +76,27 @@ class TicketResponse(BaseModel):
     status: str = Field("created", description="Ticket status")
     estimated_response_time: str = Field(..., description="Estimated response time")
     message: str = Field(..., description="Confirmation message")
+    incident_id: Optional[str] = Field(None, description="Incident this ticket is grouped under")
+    is_duplicate: bool = Field(False, description="Whether the ticket was attached to an existing incident")
+
+
+class TicketRecord(BaseModel):
+    """Stored support ticket"""
+    ticket_id: str = Field(..., description="Ticket ID")
+    conversation_id: Optional[str] = Field(None, description="Related conversation ID")
+    incident_id: str = Field(..., description="Incident this ticket is grouped under")
+    issue_description: str = Field(..., description="Issue description")
+    category: str = Field(..., description="Issue category")
+    priority: str = Field(..., description="Priority: low, medium, high, critical")
+    status: str = Field(..., description="Ticket status")
+    user_email: Optional[str] = Field(None, description="User email")
+    user_name: Optional[str] = Field(None, description="User name")
+    created_at: str = Field(..., description="ISO timestamp")
+
+
+class TicketStatusUpdate(BaseModel):
+    """Request model for changing a ticket's status"""
+    status: str = Field(..., description="New status: open, in_progress, resolved, closed")
 
 
 class HealthResponse(BaseModel):
@@ -84,3 +129,7 @@ class AnalyticsEvent(BaseModel):
     category: Optional[str] = Field(None)
     timestamp: str = Field(default_factory=lambda: datetime.utcnow().isoformat())
 
+
+class AnalyticsBatch(BaseModel):
+    """Batch of analytics events sent in a single request"""
+    events: List[AnalyticsEvent] = Field(..., min_length=1, max_length=500, description="Events to record")
@@ -0,0 +1,228 @@
+"""
+Speculative retrieval while the user is still typing
+"""
+import asyncio
+import json
+import threading
+import time
+import weakref
+from collections import OrderedDict, Counter
+from typing import Dict, List, Optional, Tuple, Callable, Any
+from langchain.docstore.document import Document
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Cache key form of a query: case, whitespace and trailing punctuation don't matter"""
+    return " ".join(text.lower().split()).rstrip("?!.,;: ")
+
+
+class RetrievalCache:
+    """
+    Short-lived cache of query embeddings and scored retrieval results.
+
+    Results are tied to the vector store object they came from, so an index
+    swap or a different tenant never sees them. Entries only hold a weak
+    reference to that store, and ``discard()`` drops a retired or evicted
+    store's results, so the cache never keeps an unloaded index alive.
+    Hit/miss counters only count lookups made while answering, not while
+    prefetching.
+    """
+
+    def __init__(self, ttl_seconds: float = 60.0, max_entries: int = 2000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results: "OrderedDict[Tuple, Tuple[float, weakref.ref, List[Tuple[Document, float]]]]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _results_key(query: str, metadata_filter: Optional[Dict[str, Any]], k: int) -> Tuple:
+        return normalize_query(query), json.dumps(metadata_filter, sort_keys=True), k
+
+    def _get_locked(self, entries: OrderedDict, key) -> Optional[tuple]:
+        entry = entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[0] > self.ttl_seconds:
+            del entries[key]
+            return None
+        entries.move_to_end(key)
+        return entry
+
+    def _put_locked(self, entries: OrderedDict, key, value: tuple):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def get_results(
+        self,
+        vector_store: Any,
+        query: str,
+        metadata_filter: Optional[Dict[str, Any]],
+        k: int,
+        count: bool = True
+    ) -> Optional[List[Tuple[Document, float]]]:
+        """Cached (document, relevance) pairs for a search, or None"""
+        with self._lock:
+            entry = self._get_locked(self._results, self._results_key(query, metadata_filter, k))
+            results = entry[2] if entry and entry[1]() is vector_store else None
+            if count:
+                if results is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return results
+
+    def put_results(
+        self,
+        vector_store: Any,
+        query: str,
+        metadata_filter: Optional[Dict[str, Any]],
+        k: int,
+        results: List[Tuple[Document, float]]
+    ):
+        with self._lock:
+            self._put_locked(
+                self._results,
+                self._results_key(query, metadata_filter, k),
+                (time.monotonic(), weakref.ref(vector_store), results)
+            )
+
+    def discard(self, vector_store: Any):
+        """Drop results for a store that is being retired, plus any already dead or expired"""
+        if vector_store is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            for key, (stored_at, store_ref, _) in list(self._results.items()):
+                store = store_ref()
+                if store is None or store is vector_store or now - stored_at > self.ttl_seconds:
+                    del self._results[key]
+
+    def get_embedding(self, query: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._get_locked(self._embeddings, normalize_query(query))
+            return entry[1] if entry else None
+
+    def put_embedding(self, query: str, embedding: List[float]):
+        with self._lock:
+            self._put_locked(self._embeddings, normalize_query(query), (time.monotonic(), embedding))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "results": len(self._results),
+                "embeddings": len(self._embeddings)
+            }
+
+
+class _ConversationState:
+    def __init__(self):
+        self.last_started = 0.0
+        self.last_key: Optional[str] = None
+        self.generation = 0
+        self.task: Optional[asyncio.Task] = None
+
+
+class PrefetchScheduler:
+    """
+    Runs prefetch work in the background without competing with real requests.
+
+    Each conversation may start at most one prefetch per ``min_interval``.
+    Starting a new one makes the previous one stale: the work function is
+    handed an ``is_stale()`` check so a thread already running can stop
+    early. When ``max_concurrent`` prefetches are running, new ones are
+    dropped rather than queued.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = 0.3,
+        max_concurrent: int = 2,
+        idle_timeout: float = 300.0,
+        max_conversations: int = 1024
+    ):
+        self.min_interval = min_interval
+        self.max_concurrent = max_concurrent
+        self.idle_timeout = idle_timeout
+        self.max_conversations = max_conversations
+
+        self._lock = threading.Lock()
+        self._running = 0
+        self._conversations: Dict[str, _ConversationState] = {}
+        self.counters = Counter()
+
+    def _prune(self, now: float):
+        """Forget conversations that have gone quiet"""
+        if len(self._conversations) <= self.max_conversations:
+            return
+        for key, state in list(self._conversations.items()):
+            if now - state.last_started > self.idle_timeout and (state.task is None or state.task.done()):
+                del self._conversations[key]
+
+    def submit(
+        self,
+        conversation_key: str,
+        text_key: str,
+        work: Callable[[Callable[[], bool]], Any]
+    ) -> str:
+        """
+        Schedule ``work(is_stale)`` in a worker thread; returns "scheduled",
+        "duplicate", "rate_limited" or "busy". Call from the event loop.
+        """
+        now = time.monotonic()
+        self._prune(now)
+        state = self._conversations.setdefault(conversation_key, _ConversationState())
+
+        if text_key == state.last_key:
+            self.counters["duplicate"] += 1
+            return "duplicate"
+        if now - state.last_started < self.min_interval:
+            self.counters["rate_limited"] += 1
+            return "rate_limited"
+
+        # Whatever is prefetching older text is stale now. The running thread
+        # sees that through is_stale() (cancelling the task can't stop it, and
+        # would skip the bookkeeping in _run if it had not started yet)
+        state.generation += 1
+        if state.task is not None and not state.task.done():
+            self.counters["cancelled"] += 1
+
+        with self._lock:
+            if self._running >= self.max_concurrent:
+                self.counters["busy"] += 1
+                return "busy"
+            self._running += 1
+
+        generation = state.generation
+        state.last_started = now
+        state.last_key = text_key
+        state.task = asyncio.create_task(
+            asyncio.to_thread(self._run, work, lambda: state.generation != generation)
+        )
+        self.counters["scheduled"] += 1
+        return "scheduled"
+
+    def _run(self, work: Callable[[Callable[[], bool]], Any], is_stale: Callable[[], bool]):
+        try:
+            if not is_stale():
+                work(is_stale)
+        except Exception as e:
+            logger.warning(f"Prefetch failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = self._running
+        return {"running": running, "conversations": len(self._conversations), **self.counters}
@@ -0,0 +1,139 @@
+"""
+Opt-in per-request profiling
+"""
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Mapping
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ProfileResult:
+    """Where a profile was saved and its hottest frames"""
+
+    def __init__(self):
+        self.profile_id: Optional[str] = None
+        self.path: Optional[str] = None
+        self.duration_ms: float = 0.0
+        self.top_frames: List[str] = []
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        """Response headers summarizing the profile"""
+        if not self.profile_id:
+            return {}
+        return {
+            "X-Profile-Id": self.profile_id,
+            "X-Profile-Duration-Ms": f"{self.duration_ms:.1f}",
+            "X-Profile-Top": "; ".join(self.top_frames)
+        }
+
+
+class RequestProfiler:
+    """
+    Profiles selected requests with cProfile and saves them as .prof files
+    (pstats format, readable by ``python -m pstats``, snakeviz, etc.).
+
+    A request is profiled when it sends ``X-Profile: 1`` with an
+    ``X-Profile-Token`` matching ``token``, or when it falls within
+    ``sample_rate``. Only one request is profiled at a time; others proceed
+    unprofiled. Only the newest ``max_files`` profiles are kept on disk.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "./profiles",
+        sample_rate: float = 0.0,
+        token: Optional[str] = None,
+        top_n: int = 5,
+        max_files: int = 200
+    ):
+        self.output_dir = output_dir
+        self.sample_rate = sample_rate
+        self.token = token
+        self.top_n = top_n
+        self.max_files = max_files
+        self._active = threading.Lock()
+
+        os.makedirs(output_dir, exist_ok=True)
+
+    def should_profile(self, headers: Mapping[str, str]) -> bool:
+        """Decide whether this request is profiled"""
+        if self.token and headers.get("x-profile") == "1":
+            supplied = headers.get("x-profile-token", "")
+            if hmac.compare_digest(supplied.encode(), self.token.encode()):
+                return True
+            logger.warning("Profiling requested with an invalid token, ignoring")
+
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def _summarize(self, stats: pstats.Stats) -> List[str]:
+        """Top frames by self time, formatted for a header"""
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        frames = []
+        for (filename, line, func), (_, _, self_time, _, _) in entries[:self.top_n]:
+            location = f"{os.path.basename(filename)}:{line}" if line else filename
+            frame = f"{func}@{location}={self_time * 1000:.1f}ms"
+            # Header values must stay ASCII
+            frames.append(frame.encode("ascii", "replace").decode("ascii"))
+        return frames
+
+    def _prune(self):
+        """Delete the oldest .prof files beyond ``max_files``"""
+        paths = [
+            os.path.join(self.output_dir, name)
+            for name in os.listdir(self.output_dir)
+            if name.endswith(".prof")
+        ]
+        if len(paths) <= self.max_files:
+            return
+
+        paths.sort(key=os.path.getmtime)
+        for path in paths[:len(paths) - self.max_files]:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not delete old profile {path}: {str(e)}")
+
+    @contextmanager
+    def profile(self, label: str):
+        """Profile the enclosed block; yields a ProfileResult filled in on exit"""
+        result = ProfileResult()
+
+        # cProfile can't nest; concurrent profile requests run unprofiled
+        if not self._active.acquire(blocking=False):
+            yield result
+            return
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+            try:
+                yield result
+            finally:
+                profiler.disable()
+                result.duration_ms = (time.perf_counter() - started) * 1000
+        finally:
+            self._active.release()
+
+        result.profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:8]}"
+        result.path = os.path.join(self.output_dir, f"{result.profile_id}.prof")
+
+        try:
+            stats = pstats.Stats(profiler)
+            stats.dump_stats(result.path)
+            result.top_frames = self._summarize(stats)
+            logger.info(f"Saved profile {result.path} ({result.duration_ms:.1f}ms)")
+            self._prune()
+        except Exception as e:
+            logger.error(f"Error saving profile {result.path}: {str(e)}")
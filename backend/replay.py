@@ -0,0 +1,237 @@
+"""
+Deterministic replay of captured traffic (see traffic_capture.py)
+
+Start the server with ``LLM_STUB=true`` (optionally ``LLM_STUB_LATENCY_MS``)
+so answers are canned and only retrieval, routing and our own code are
+measured, then run e.g.::
+
+    python replay.py traffic.trace.jsonl --speed 4 --admin-token $ADMIN_TOKEN
+"""
+import asyncio
+import json
+import math
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Any
+import httpx
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+PERCENTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """Captured requests ordered by arrival"""
+    records = []
+    # A file may hold several captures; each restarts the clock, so later
+    # captures are shifted to follow the earlier ones
+    offset = latest = 0.0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "capture_start":
+                offset = latest
+            elif record.get("type") == "request":
+                record["t"] += offset
+                latest = max(latest, record["t"])
+                records.append(record)
+
+    return sorted(records, key=lambda r: r["t"])
+
+
+def group_sessions(records: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """
+    Split the trace into conversations. A turn sent without a conversation
+    starts a new one, keyed by the conversation the server assigned it.
+    """
+    sessions: Dict[str, List[Dict[str, Any]]] = {}
+    for position, record in enumerate(records):
+        key = record["conversation"] or record["response_conversation"] or f"anonymous-{position}"
+        sessions.setdefault(key, []).append(record)
+    return list(sessions.values())
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(fraction * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+class TraceReplayer:
+    """
+    Re-drives captured conversations against a running server.
+
+    Turns keep their captured arrival offsets divided by ``speed`` (0 sends
+    as fast as possible); turns within a conversation stay sequential because
+    each needs the conversation ID returned by the previous one.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        speed: float = 1.0,
+        timeout: float = 60.0,
+        admin_token: Optional[str] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.speed = speed
+        self.timeout = timeout
+        self.admin_token = admin_token
+        self.results: List[Dict[str, Any]] = []
+
+    async def _send(self, client: httpx.AsyncClient, record: Dict[str, Any], conversation_id: Optional[str]) -> httpx.Response:
+        if record["endpoint"] == "quick_action":
+            params = {"conversation_id": conversation_id, "tenant_id": record.get("tenant_id")}
+            return await client.post(
+                f"/quick-action/{record['action_id']}",
+                params={k: v for k, v in params.items() if v is not None}
+            )
+
+        return await client.post("/chat", json={
+            "message": record["message"],
+            "conversation_id": conversation_id,
+            "user_context": record.get("user_context") or None,
+            "tenant_id": record.get("tenant_id")
+        })
+
+    async def _replay_session(self, client: httpx.AsyncClient, session: List[Dict[str, Any]], started: float):
+        conversation_id = None
+        for record in session:
+            if self.speed > 0:
+                delay = started + record["t"] / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            # How far behind the captured schedule this turn went out
+            lag_ms = max(time.monotonic() - started - record["t"] / self.speed, 0) * 1000 if self.speed > 0 else 0.0
+
+            sent = time.perf_counter()
+            try:
+                response = await self._send(client, record, conversation_id)
+                status_code = response.status_code
+                if response.is_success:
+                    conversation_id = response.json()["conversation_id"]
+            except httpx.HTTPError as e:
+                logger.error(f"Request failed: {str(e)}")
+                status_code = None
+
+            self.results.append({
+                "endpoint": record["endpoint"],
+                "latency_ms": (time.perf_counter() - sent) * 1000,
+                "captured_ms": record.get("duration_ms"),
+                "status_code": status_code,
+                "lag_ms": lag_ms
+            })
+
+    async def _cache_stats(self, client: httpx.AsyncClient) -> Optional[Dict[str, Any]]:
+        if not self.admin_token:
+            return None
+        try:
+            response = await client.get("/admin/cache-stats", headers={"X-Admin-Token": self.admin_token})
+            response.raise_for_status()
+            return response.json()
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not read cache stats: {str(e)}")
+            return None
+
+    async def run(self, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Replay the trace and return the report"""
+        sessions = group_sessions(records)
+        logger.info(f"Replaying {len(records)} requests in {len(sessions)} conversations at {self.speed or 'max'}x")
+
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=limits) as client:
+            before = await self._cache_stats(client)
+
+            self.results = []
+            started = time.monotonic()
+            await asyncio.gather(*(self._replay_session(client, s, started) for s in sessions))
+            elapsed = time.monotonic() - started
+
+            after = await self._cache_stats(client)
+
+        return self.report(elapsed, before, after)
+
+    def report(
+        self,
+        elapsed: float,
+        stats_before: Optional[Dict[str, Any]] = None,
+        stats_after: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Latency distribution per endpoint, error counts and cache hit rates"""
+        by_endpoint = defaultdict(list)
+        errors = Counter()
+        for result in self.results:
+            if result["status_code"] is not None and 200 <= result["status_code"] < 300:
+                by_endpoint[result["endpoint"]].append(result["latency_ms"])
+                by_endpoint["all"].append(result["latency_ms"])
+            else:
+                errors[str(result["status_code"])] += 1
+
+        latency = {
+            endpoint: {
+                "count": len(values),
+                **{f"p{int(p * 100)}": round(percentile(values, p), 1) for p in PERCENTILES},
+                "max": round(max(values), 1)
+            }
+            for endpoint, values in by_endpoint.items()
+        }
+
+        report = {
+            "requests": len(self.results),
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(len(self.results) / elapsed, 2) if elapsed else None,
+            "errors": dict(errors),
+            "max_schedule_lag_ms": round(max((r["lag_ms"] for r in self.results), default=0.0), 1),
+            "latency_ms": latency
+        }
+
+        if stats_before and stats_after:
+            report["server_caches"] = {}
+            for name, counters in stats_after.items():
+                if not isinstance(counters, dict) or "hits" not in counters:
+                    continue
+                previous = stats_before.get(name) or {}
+                hits = counters["hits"] - previous.get("hits", 0)
+                misses = counters["misses"] - previous.get("misses", 0)
+                report["server_caches"][name] = {
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None
+                }
+
+        return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay captured chat traffic against a running server")
+    parser.add_argument("trace_path")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--speed", type=float, default=1.0, help="Time acceleration; 0 sends as fast as possible")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--admin-token", default=None, help="Read server cache counters before and after")
+    parser.add_argument("--output", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+
+    replayer = TraceReplayer(
+        base_url=args.base_url,
+        speed=args.speed,
+        timeout=args.timeout,
+        admin_token=args.admin_token
+    )
+    result = asyncio.run(replayer.run(load_trace(args.trace_path)))
+
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,112 @@
+"""
+Confidence-gated cross-encoder re-ranking of retrieved documents
+"""
+import math
+import threading
+from typing import List, Tuple
+from langchain.docstore.document import Document
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class ConfidenceGatedReranker:
+    """
+    Re-ranks retrieval candidates with a local CPU cross-encoder, but only
+    when the retriever's top two scores are too close to call.
+
+    When the ordering is clear (either from retrieval or after re-ranking) the
+    context is trimmed to the one or two documents that actually matter.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "cross-encoder/ms-marco-MiniLM-L-6-v2",
+        ambiguity_margin: float = 0.05,
+        confident_margin: float = 0.15,
+        keep_threshold: float = 0.5,
+        max_length: int = 512
+    ):
+        self.model_name = model_name
+        self.ambiguity_margin = ambiguity_margin
+        self.confident_margin = confident_margin
+        self.keep_threshold = keep_threshold
+        self.max_length = max_length
+
+        self._model = None
+        self._load_lock = threading.Lock()
+        self.reranked_count = 0
+        self.skipped_count = 0
+
+    def load(self) -> bool:
+        """Load the cross-encoder once; returns False if it is unavailable"""
+        with self._load_lock:
+            if self._model is not None:
+                return True
+
+            try:
+                from sentence_transformers import CrossEncoder
+            except ImportError:
+                logger.warning("sentence-transformers not installed, re-ranking disabled")
+                return False
+
+            logger.info(f"Loading cross-encoder {self.model_name} on CPU...")
+            try:
+                self._model = CrossEncoder(self.model_name, device="cpu", max_length=self.max_length)
+            except Exception as e:
+                # e.g. no network to download the model; serve without re-ranking
+                logger.error(f"Could not load cross-encoder {self.model_name}, re-ranking disabled: {str(e)}")
+                return False
+            return True
+
+    @property
+    def available(self) -> bool:
+        return self._model is not None
+
+    def _score(self, query: str, documents: List[Document]) -> List[float]:
+        """Score all (query, document) pairs in a single batched forward pass"""
+        pairs = [(query, doc.page_content) for doc in documents]
+        logits = self._model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        return [1.0 / (1.0 + math.exp(-float(logit))) for logit in logits]
+
+    def rerank(
+        self,
+        query: str,
+        scored_documents: List[Tuple[Document, float]],
+        k: int
+    ) -> List[Document]:
+        """
+        Re-rank (document, relevance) candidates and return at most k documents.
+
+        Candidates must be sorted by descending relevance, as returned by
+        ``similarity_search_with_relevance_scores``.
+        """
+        documents = [doc for doc, _ in scored_documents]
+        if len(scored_documents) < 2 or not self.available:
+            return documents[:k]
+
+        margin = scored_documents[0][1] - scored_documents[1][1]
+
+        if margin >= self.ambiguity_margin:
+            # Retrieval already has a clear winner; skip the cross-encoder
+            self.skipped_count += 1
+            if margin >= self.confident_margin:
+                return documents[:1]
+            return documents[:k]
+
+        self.reranked_count += 1
+        scores = self._score(query, documents)
+        ranked = sorted(zip(documents, scores), key=lambda item: item[1], reverse=True)
+
+        top_score = ranked[0][1]
+        if top_score - ranked[1][1] >= self.confident_margin:
+            return [ranked[0][0]]
+
+        # Confidently relevant documents are enough context on their own
+        kept = [doc for doc, score in ranked if score >= self.keep_threshold]
+        if kept:
+            return kept[:min(2, k)]
+
+        # Nothing the cross-encoder is confident about; keep the best few
+        return [doc for doc, _ in ranked[:k]]
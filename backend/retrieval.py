@@ -0,0 +1,453 @@
+"""
+Metadata-filtered retrieval with fallback to global search
+"""
+import math
+import re
+import statistics
+import weakref
+from typing import List, Dict, Optional, Tuple, Callable, Any, Collection, Set
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain.docstore.document import Document
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+# user_context key -> metadata field it filters on
+CONTEXT_FILTER_FIELDS = {
+    "category": "category",
+    "priority": "priority",
+    "os": "os",
+    "department": "department",
+}
+
+# Fields where documents may apply to everyone; matched with value OR "any"
+WILDCARD_FIELDS = {"os", "department"}
+
+
+def build_metadata_filter(
+    category: Optional[str] = None,
+    user_context: Optional[Dict[str, Any]] = None,
+    indexed_fields: Optional[Collection[str]] = None
+) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Translate a category and structured user context into a Chroma filter.
+
+    Returns (filter, remaining_context) where remaining_context holds the
+    user_context entries that are not filterable and should stay free text.
+    With ``indexed_fields`` (see ``indexed_metadata_fields()``), fields the
+    index doesn't have are not filtered on either.
+    """
+    conditions = []
+    remaining = {}
+
+    if category and (indexed_fields is None or "category" in indexed_fields):
+        conditions.append({"category": category})
+
+    for key, value in (user_context or {}).items():
+        field = CONTEXT_FILTER_FIELDS.get(key.lower())
+        if field is None or not isinstance(value, str) or not value.strip():
+            remaining[key] = value
+            continue
+        if indexed_fields is not None and field not in indexed_fields:
+            remaining[key] = value
+            continue
+        if field == "category" and category:
+            # An explicit category (e.g. from a quick action) takes precedence
+            continue
+
+        value = value.strip().lower()
+        if field in WILDCARD_FIELDS:
+            conditions.append({field: {"$in": [value, "any"]}})
+        else:
+            conditions.append({field: value})
+
+    if not conditions:
+        return None, remaining
+    if len(conditions) == 1:
+        return conditions[0], remaining
+    return {"$and": conditions}, remaining
+
+
+# Metadata fields of loaded indexes, dropped with their vector store
+_indexed_fields: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def indexed_metadata_fields(vector_store: Any, sample_size: int = 20) -> Optional[Set[str]]:
+    """
+    Metadata fields every sampled chunk of an index carries (None if unknown).
+
+    Indexes built before a field was introduced would match no document
+    when filtered on it, so those fields are left out of the filter until
+    the index is rebuilt. Sampled once per vector store.
+    """
+    try:
+        return _indexed_fields[vector_store]
+    except KeyError:
+        pass
+    except TypeError:
+        # Not weak-referenceable (e.g. a test double)
+        return None
+
+    try:
+        metadatas = vector_store._collection.get(limit=sample_size, include=["metadatas"]).get("metadatas")
+    except Exception as e:
+        logger.warning(f"Could not sample index metadata: {str(e)}")
+        return None
+    if not metadatas:
+        return None
+
+    fields = set.intersection(*(set(metadata or {}) for metadata in metadatas))
+    missing = sorted(set(CONTEXT_FILTER_FIELDS.values()) - fields)
+    if missing:
+        logger.warning(f"Index has no {missing} metadata; not filtering on it until the index is rebuilt")
+    _indexed_fields[vector_store] = fields
+    return fields
+
+
+# Calibrated slopes are capped here; steeper ones come from near-identical
+# match/near-miss scores and would swing confidence on noise
+MAX_CALIBRATED_SLOPE = 50.0
+
+# Logits are clamped so extreme scores (e.g. from unnormalized embeddings)
+# can't overflow math.exp
+MAX_LOGIT = 50.0
+
+# Candidates whose score is within this many logit units (divided by the
+# slope) of the best one count as equally relevant; 0.05 at the default slope
+RELEVANCE_WINDOW_LOGIT = 0.6
+
+
+class ConfidenceCalibration:
+    """
+    Parameters of the logistic that maps relevance scores to confidence.
+
+    ``midpoint`` is the top score that means 50% confidence and ``slope`` how
+    quickly confidence rises around it. Relevance scales differ per embedding
+    model and distance function, so these are fitted per index by
+    ``calibrate_confidence()``; the constructor defaults are only a fallback.
+    """
+
+    def __init__(
+        self,
+        midpoint: float = 0.75,
+        slope: float = 12.0,
+        margin_weight: Optional[float] = None,
+        source: str = "default"
+    ):
+        if not math.isfinite(midpoint) or not math.isfinite(slope) or slope <= 0:
+            raise ValueError(f"Invalid confidence calibration (midpoint={midpoint}, slope={slope})")
+        self.midpoint = midpoint
+        self.slope = slope
+        # The runner-up margin counts half as much as the top score
+        self.margin_weight = slope / 2 if margin_weight is None else margin_weight
+        self.source = source
+
+    @property
+    def relevance_window(self) -> float:
+        """Score difference that adaptive depth treats as a tie, in this index's units"""
+        return RELEVANCE_WINDOW_LOGIT / self.slope
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "midpoint": round(self.midpoint, 4),
+            "slope": round(self.slope, 2),
+            "margin_weight": round(self.margin_weight, 2),
+            "relevance_window": round(self.relevance_window, 4),
+            "source": self.source
+        }
+
+
+# Calibrations fitted for loaded indexes, dropped with their vector store
+_calibrations: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def register_calibration(vector_store: Any, calibration: ConfidenceCalibration):
+    _calibrations[vector_store] = calibration
+
+
+def get_calibration(vector_store: Any) -> Optional[ConfidenceCalibration]:
+    try:
+        return _calibrations.get(vector_store)
+    except TypeError:
+        # Not weak-referenceable (e.g. a test double)
+        return None
+
+
+def _strip_title(text: str, title: str) -> str:
+    """Remove a title (raw or with underscores as spaces) from a chunk's text"""
+    for form in {title, title.replace("_", " ")}:
+        text = re.sub(re.escape(form), " ", text, flags=re.IGNORECASE)
+    return text
+
+
+def _distance(a: List[float], b: List[float], space: str) -> float:
+    """Distance between two embeddings as Chroma computes it for ``space``"""
+    dot = sum(x * y for x, y in zip(a, b))
+    if space == "ip":
+        return 1.0 - dot
+    if space == "cosine":
+        norms = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return 1.0 - (dot / norms if norms else 0.0)
+    # l2 is squared in Chroma
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+def calibrate_confidence(
+    vector_store: Any,
+    sample_size: int = 50,
+    target_confidence: float = 0.9,
+    candidates: int = 10
+) -> Optional[ConfidenceCalibration]:
+    """
+    Fit a calibration from the collection's own score distribution.
+
+    Each sampled chunk's ``issue`` title is used as a query. Titles appear
+    verbatim in their chunks, which would make every match look perfect, so
+    the known good match is scored against the chunk with the title
+    stripped out; the best score of any other document is a near miss. The
+    midpoint is placed halfway between the median good match and median
+    near miss, and the slope chosen so the median good match gets
+    ``target_confidence`` (capped at MAX_CALIBRATED_SLOPE). Costs one
+    batched embedding call and one batched query; returns None when the
+    collection is too small or the two distributions don't separate.
+    """
+    collection = vector_store._collection
+    sample = collection.get(limit=sample_size, include=["metadatas", "documents"])
+
+    queries, held_out, expected = [], [], []
+    seen = set()
+    for metadata, text in zip(sample.get("metadatas") or [], sample.get("documents") or []):
+        metadata = metadata or {}
+        issue, doc_id = metadata.get("issue"), metadata.get("doc_id")
+        if issue and text and doc_id is not None and doc_id not in seen:
+            seen.add(doc_id)
+            queries.append(str(issue).replace("_", " "))
+            held_out.append(_strip_title(text, str(issue)))
+            expected.append(doc_id)
+
+    if len(queries) < 5:
+        return None
+
+    vectors = vector_store.embeddings.embed_documents(queries + held_out)
+    query_vectors, chunk_vectors = vectors[:len(queries)], vectors[len(queries):]
+    results = collection.query(
+        query_embeddings=query_vectors,
+        n_results=candidates,
+        include=["metadatas", "distances"]
+    )
+    relevance = vector_store._select_relevance_score_fn()
+    space = (getattr(collection, "metadata", None) or {}).get("hnsw:space", "l2")
+
+    matches = [relevance(_distance(q, c, space)) for q, c in zip(query_vectors, chunk_vectors)]
+    near_misses = []
+    for doc_id, metadatas, distances in zip(expected, results["metadatas"], results["distances"]):
+        other = [relevance(d) for m, d in zip(metadatas, distances) if (m or {}).get("doc_id") != doc_id]
+        if other:
+            near_misses.append(max(other))
+
+    if not near_misses:
+        return None
+
+    good, miss = statistics.median(matches), statistics.median(near_misses)
+    if good - miss < 0.01:
+        logger.warning(f"Confidence calibration skipped: matches ({good:.3f}) don't beat near misses ({miss:.3f})")
+        return None
+
+    midpoint = (good + miss) / 2
+    slope = math.log(target_confidence / (1 - target_confidence)) / (good - midpoint)
+    if slope > MAX_CALIBRATED_SLOPE:
+        logger.warning(f"Calibrated slope {slope:.1f} capped at {MAX_CALIBRATED_SLOPE}: matches barely beat near misses")
+        slope = MAX_CALIBRATED_SLOPE
+    calibration = ConfidenceCalibration(midpoint=midpoint, slope=slope, source="calibrated")
+    logger.info(
+        f"Calibrated retrieval confidence from {len(matches)} samples "
+        f"(match median {good:.3f}, near-miss median {miss:.3f}): {calibration.as_dict()}"
+    )
+    return calibration
+
+
+def retrieval_confidence(
+    scores: List[float],
+    calibration: Optional[ConfidenceCalibration] = None
+) -> float:
+    """
+    Map relevance scores to a 0-1 confidence.
+
+    A logistic curve over the top score, shifted up when the top result
+    clearly beats the runner-up (see ConfidenceCalibration).
+    """
+    if not scores:
+        return 0.0
+
+    calibration = calibration or ConfidenceCalibration()
+    margin = scores[0] - scores[1] if len(scores) > 1 else 0.0
+    logit = calibration.slope * (scores[0] - calibration.midpoint) + calibration.margin_weight * margin
+    logit = max(-MAX_LOGIT, min(logit, MAX_LOGIT))
+    return 1.0 / (1.0 + math.exp(-logit))
+
+
+def adaptive_depth(
+    scores: List[float],
+    confidence: float,
+    min_k: int = 1,
+    max_k: int = 5,
+    relevance_window: float = 0.05,
+    low_confidence: float = 0.4
+) -> int:
+    """
+    Pick how many documents to put in the context.
+
+    Keeps the candidates scoring within ``relevance_window`` of the best one
+    (see ConfidenceCalibration.relevance_window), so a single dominant
+    article yields a short context, and widens to ``max_k`` when confidence
+    is low and the query is ambiguous.
+    """
+    if not scores:
+        return 0
+    if confidence < low_confidence:
+        return min(max_k, len(scores))
+
+    depth = sum(1 for score in scores if score >= scores[0] - relevance_window)
+    return max(min_k, min(depth, max_k, len(scores)))
+
+
+class FilteredRetriever(BaseRetriever):
+    """
+    Searches within a metadata filter first and falls back to the whole
+    collection when the filtered results are missing or score poorly.
+
+    With ``adaptive`` set, ``k`` is the maximum depth and the number of
+    documents returned follows the retrieval confidence. The confidence and
+    depth of the last retrieval are kept in ``retrieval_stats``. An optional
+    ``cache`` (see prefetch.RetrievalCache) serves embeddings and candidate
+    lists warmed by ``/prefetch``.
+    """
+
+    vector_store: Any
+    k: int = 3
+    min_k: int = 1
+    adaptive: bool = False
+    metadata_filter: Optional[Dict[str, Any]] = None
+    min_relevance: float = 0.3
+    reranker: Optional[Any] = None
+    rerank_candidates: int = 6
+    calibration: Optional[Any] = None
+    low_confidence: float = 0.4
+    cache: Optional[Any] = None
+    count_cache_lookups: bool = True
+    retrieval_stats: Optional[Dict[str, Any]] = None
+
+    @property
+    def fetch_k(self) -> int:
+        """Number of candidates to retrieve (more when a re-ranker will trim them)"""
+        if self.reranker is not None and self.reranker.available:
+            return max(self.k, self.rerank_candidates)
+        return self.k
+
+    def _embed(self, query: str) -> List[float]:
+        """Query embedding, shared between the filtered and fallback searches"""
+        embedding = self.cache.get_embedding(query) if self.cache is not None else None
+        if embedding is None:
+            embedding = self.vector_store.embeddings.embed_query(query)
+            if self.cache is not None:
+                self.cache.put_embedding(query, embedding)
+        return embedding
+
+    def _search(
+        self,
+        embedding: List[float],
+        k: int,
+        metadata_filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Search by vector, converting Chroma distances to relevance scores"""
+        results = self.vector_store.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, filter=metadata_filter
+        )
+        relevance = self.vector_store._select_relevance_score_fn()
+        return [(doc, relevance(distance)) for doc, distance in results]
+
+    def search_with_scores(self, query: str) -> List[Tuple[Document, float]]:
+        """Filtered search with global fallback, returning relevance scores"""
+        fetch_k = self.fetch_k
+        if self.cache is not None:
+            cached = self.cache.get_results(
+                self.vector_store, query, self.metadata_filter, fetch_k, count=self.count_cache_lookups
+            )
+            if cached is not None:
+                return cached
+
+        embedding = self._embed(query)
+        results = None
+        if self.metadata_filter:
+            try:
+                results = self._search(embedding, fetch_k, self.metadata_filter)
+            except Exception as e:
+                logger.warning(f"Filtered search failed, using global search: {str(e)}")
+                results = []
+
+            if not results or results[0][1] < self.min_relevance:
+                logger.info(
+                    f"Filtered search weak (best={results[0][1] if results else None}), "
+                    f"falling back to global search"
+                )
+                results = None
+
+        if results is None:
+            results = self._search(embedding, fetch_k)
+
+        if self.cache is not None:
+            self.cache.put_results(self.vector_store, query, self.metadata_filter, fetch_k, results)
+        return results
+
+    def warm(self, query: str, is_stale: Optional[Callable[[], bool]] = None) -> bool:
+        """
+        Populate the cache for a query ahead of the real request.
+
+        Stops between the embedding and the search once ``is_stale()`` is
+        true; returns whether a search ran.
+        """
+        if self.cache is None:
+            return False
+        if self.cache.get_results(self.vector_store, query, self.metadata_filter, self.fetch_k, count=False):
+            return False
+
+        self._embed(query)
+        if is_stale is not None and is_stale():
+            return False
+
+        self.search_with_scores(query)
+        return True
+
+    def _get_relevant_documents(
+        self,
+        query: str,
+        *,
+        run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        scored = self.search_with_scores(query)
+        scores = [score for _, score in scored]
+        # An explicit calibration wins over the one fitted for this index
+        calibration = self.calibration or get_calibration(self.vector_store) or ConfidenceCalibration()
+        confidence = retrieval_confidence(scores, calibration)
+
+        depth = self.k
+        if self.adaptive:
+            depth = adaptive_depth(
+                scores, confidence, min_k=self.min_k, max_k=self.k,
+                relevance_window=calibration.relevance_window, low_confidence=self.low_confidence
+            )
+
+        if self.reranker is not None:
+            documents = self.reranker.rerank(query, scored, depth)
+        else:
+            documents = [doc for doc, _ in scored[:depth]]
+
+        self.retrieval_stats = {
+            "confidence": confidence,
+            "top_score": scores[0] if scores else None,
+            "depth": len(documents)
+        }
+        return documents
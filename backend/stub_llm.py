@@ -0,0 +1,49 @@
+"""
+Deterministic stand-in for the chat model, used for load tests and replays
+"""
+import re
+import time
+from typing import Any, List, Optional
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import SimpleChatModel
+from langchain_core.messages import BaseMessage
+
+
+FOLLOW_UP_RE = re.compile(r"Follow Up Input:\s*(.*?)\s*Standalone question:", re.DOTALL)
+
+
+class StubChatModel(SimpleChatModel):
+    """
+    Returns canned answers after a fixed delay instead of calling OpenAI.
+
+    Question-condensing prompts echo the follow-up question back, so
+    retrieval still sees the real user text.
+    """
+
+    latency_ms: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "stub-chat"
+
+    def _call(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any
+    ) -> str:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+        prompt = "\n".join(str(message.content) for message in messages)
+        follow_up = FOLLOW_UP_RE.search(prompt)
+        if follow_up:
+            return follow_up.group(1)
+
+        return (
+            "Here are the steps from the knowledge base:\n"
+            "1. Restart the affected application\n"
+            "2. Check for updates\n"
+            "3. Contact IT support if the issue persists"
+        )
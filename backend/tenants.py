@@ -0,0 +1,271 @@
+"""
+Per-tenant knowledge bases and chat engines with an LRU of loaded indexes
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional, Callable, Any
+from knowledge_base import KnowledgeBaseLoader
+from chat_engine import ITHelpdeskChatEngine
+from index_manager import IndexManager, IndexVersion, resident_chroma_systems
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_TENANT = "default"
+
+
+class UnknownTenantError(KeyError):
+    """Raised for tenant IDs that are not configured"""
+
+
+def load_tenant_configs(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Load tenant definitions from a JSON file of the form
+    ``{"<tenant_id>": {"collection_name": ..., "csv_path": ..., "docs_directory": ...,
+    "persist_directory": ..., "prompt_preamble": ...}}``
+    """
+    if not path:
+        return {}
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Tenant config not found: {path}")
+
+    with open(path) as f:
+        configs = json.load(f)
+
+    logger.info(f"Loaded {len(configs)} tenant definitions from {path}")
+    return configs
+
+
+def directory_size(path: str) -> int:
+    """Bytes on disk under a directory, used as the resident-size estimate of an index"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+class TenantRuntime:
+    """A tenant's chat engine plus its (possibly unloaded) index"""
+
+    def __init__(self, tenant_id: str, config: Dict[str, Any]):
+        self.tenant_id = tenant_id
+        self.config = config
+        self.chat_engine: Optional[ITHelpdeskChatEngine] = None
+        self.index_manager: Optional[IndexManager] = None
+        self.estimated_bytes = 0
+        self.load_lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self.index_manager is not None
+
+
+class TenantPool:
+    """
+    Routes requests to per-tenant indexes and chat engines.
+
+    Indexes load lazily on first use and stay resident in LRU order while the
+    estimated total stays under ``memory_budget_bytes``; the least recently
+    used idle tenants are unloaded beyond that. Chat engines (and so their
+    conversations) are kept per tenant and survive index eviction. The default
+    tenant is pinned and never evicted.
+    """
+
+    def __init__(
+        self,
+        default_runtime: TenantRuntime,
+        configs: Dict[str, Dict[str, Any]],
+        loader_factory: Callable[[str, Dict[str, Any]], KnowledgeBaseLoader],
+        engine_factory: Callable[[Any, Dict[str, Any]], ITHelpdeskChatEngine],
+        memory_budget_bytes: int,
+        index_options: Optional[Dict[str, Any]] = None
+    ):
+        self.configs = configs
+        self.loader_factory = loader_factory
+        self.engine_factory = engine_factory
+        self.memory_budget_bytes = memory_budget_bytes
+        self.index_options = index_options or {}
+
+        self._lock = threading.Lock()
+        self._runtimes: Dict[str, TenantRuntime] = {DEFAULT_TENANT: default_runtime}
+        self._lru: "OrderedDict[str, int]" = OrderedDict()
+        self.evictions = 0
+        self.hits = 0
+        self.loads = 0
+
+    def _runtime(self, tenant_id: Optional[str]) -> TenantRuntime:
+        """Get (or create the unloaded shell of) a tenant's runtime"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        with self._lock:
+            runtime = self._runtimes.get(tenant_id)
+            if runtime is None:
+                if tenant_id not in self.configs:
+                    raise UnknownTenantError(tenant_id)
+                runtime = TenantRuntime(tenant_id, self.configs[tenant_id])
+                self._runtimes[tenant_id] = runtime
+            return runtime
+
+    def _load(self, runtime: TenantRuntime):
+        """Load a tenant's index (blocking) and register it in the LRU"""
+        config = runtime.config
+        persist_directory = config.get(
+            "persist_directory",
+            os.path.join(os.getenv("TENANTS_ROOT", "./tenants"), runtime.tenant_id, "chroma_db")
+        )
+
+        logger.info(f"Loading index for tenant {runtime.tenant_id}...")
+        kb_loader = self.loader_factory(persist_directory, config)
+        index_manager = IndexManager(
+            kb_loader=kb_loader,
+            loader_factory=lambda directory: self.loader_factory(directory, config),
+            **self.index_options
+        )
+        version = index_manager.initialize()
+
+        if runtime.chat_engine is None:
+            runtime.chat_engine = self.engine_factory(version.vector_store, config)
+        else:
+            runtime.chat_engine.set_vector_store(version.vector_store)
+        engine = runtime.chat_engine
+        index_manager.on_swap = lambda v: engine.set_vector_store(v.vector_store)
+
+        runtime.estimated_bytes = directory_size(version.persist_directory)
+        with self._lock:
+            runtime.index_manager = index_manager
+            self._lru[runtime.tenant_id] = runtime.estimated_bytes
+            self._lru.move_to_end(runtime.tenant_id)
+            self._evict_locked(keep=runtime.tenant_id)
+
+    def _evict_locked(self, keep: str):
+        """Unload idle least-recently-used tenants until under budget (lock held)"""
+        total = sum(self._lru.values())
+        for tenant_id in list(self._lru):
+            if total <= self.memory_budget_bytes:
+                break
+            runtime = self._runtimes[tenant_id]
+            manager = runtime.index_manager
+            if tenant_id == keep or manager is None or manager.in_flight or manager.building:
+                continue
+
+            total -= self._lru.pop(tenant_id)
+            runtime.index_manager = None
+            if runtime.chat_engine is not None:
+                # Also drops the store's cached retrieval results
+                runtime.chat_engine.set_vector_store(None)
+            # Dropping references alone leaves chromadb's cached System (and
+            # its HNSW segments) resident
+            manager.close()
+            self.evictions += 1
+            logger.info(f"Evicted index for tenant {tenant_id} ({runtime.estimated_bytes} bytes)")
+
+    def get_engine(self, tenant_id: Optional[str]) -> Optional[ITHelpdeskChatEngine]:
+        """A tenant's chat engine without loading its index (None if never used)"""
+        return self._runtime(tenant_id).chat_engine
+
+    def _ensure_loaded(self, runtime: TenantRuntime) -> bool:
+        """Load a tenant's index if it isn't resident; returns whether it was already"""
+        with runtime.load_lock:
+            if runtime.loaded:
+                return True
+            self._load(runtime)
+            self.loads += 1
+            return False
+
+    def ensure_loaded(self, tenant_id: Optional[str]):
+        """
+        Make a tenant's index resident ahead of ``acquire()``. Blocking: async
+        callers run it with ``asyncio.to_thread`` so a cold tenant doesn't
+        stall the event loop.
+        """
+        if self._ensure_loaded(self._runtime(tenant_id)):
+            self.hits += 1
+
+    def get_index_manager(self, tenant_id: Optional[str]) -> IndexManager:
+        """A tenant's index manager, loading the index if needed (blocking)"""
+        runtime = self._runtime(tenant_id)
+        self._ensure_loaded(runtime)
+        return runtime.index_manager
+
+    @contextmanager
+    def acquire(self, tenant_id: Optional[str]):
+        """
+        Yield (chat_engine, index_version) for a tenant, pinning the version so
+        it can't be evicted mid-request. Loads the index inline if needed, so
+        async callers should call ``ensure_loaded`` off the event loop first.
+        """
+        runtime = self._runtime(tenant_id)
+
+        while True:
+            self._ensure_loaded(runtime)
+
+            with self._lock:
+                manager = runtime.index_manager
+                if manager is None:
+                    # Evicted between loading and pinning; load again
+                    continue
+                version: IndexVersion = manager.pin()
+                if runtime.tenant_id in self._lru:
+                    self._lru.move_to_end(runtime.tenant_id)
+            break
+
+        try:
+            yield runtime.chat_engine, version
+        finally:
+            manager.release(version)
+
+    @contextmanager
+    def acquire_if_loaded(self, tenant_id: Optional[str]):
+        """
+        Like ``acquire()`` but never loads: yields None when the tenant's index
+        isn't resident. For speculative work (prefetch) that shouldn't page an
+        evicted tenant back in or keep it warm in the LRU.
+        """
+        runtime = self._runtime(tenant_id)
+
+        with self._lock:
+            manager = runtime.index_manager
+            version: Optional[IndexVersion] = manager.pin() if manager is not None else None
+
+        if version is None:
+            yield None
+            return
+
+        try:
+            yield runtime.chat_engine, version
+        finally:
+            manager.release(version)
+
+    def status(self) -> Dict[str, Any]:
+        """Loaded tenants in LRU order and memory accounting"""
+        with self._lock:
+            return {
+                "configured": sorted(self.configs),
+                "loaded": list(self._lru),
+                "estimated_bytes": sum(self._lru.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "evictions": self.evictions,
+                "hits": self.hits,
+                "loads": self.loads,
+                "resident_chroma_systems": resident_chroma_systems()
+            }
+
+
+def create_default_runtime(
+    chat_engine: ITHelpdeskChatEngine,
+    index_manager: IndexManager
+) -> TenantRuntime:
+    """Wrap the process-wide engine and index as the pinned default tenant"""
+    runtime = TenantRuntime(DEFAULT_TENANT, {})
+    runtime.chat_engine = chat_engine
+    runtime.index_manager = index_manager
+    return runtime
+
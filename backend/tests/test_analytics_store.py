@@ -0,0 +1,33 @@
+from analytics_store import AnalyticsStore
+
+
+def make_store(tmp_path, latencies, category="networking"):
+    store = AnalyticsStore(db_path=str(tmp_path / "analytics.db"))
+    store.insert_many([
+        {
+            "event_type": "chat_response",
+            "response_time_ms": value,
+            "category": category,
+            "timestamp": "2024-01-01T00:00:00"
+        }
+        for value in latencies
+    ])
+    return store
+
+
+def latency(store, percentile):
+    [result] = store.latency_percentile_by_category(percentile)
+    return result["response_time_ms"]
+
+
+def test_latency_percentile_is_nearest_rank(tmp_path):
+    store = make_store(tmp_path, range(1, 21))
+    assert latency(store, 0.5) == 10
+    assert latency(store, 0.95) == 19
+    assert latency(store, 1.0) == 20
+
+
+def test_latency_percentile_single_value(tmp_path):
+    store = make_store(tmp_path, [42])
+    assert latency(store, 0.01) == 42
+    assert latency(store, 0.99) == 42
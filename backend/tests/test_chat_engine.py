@@ -0,0 +1,77 @@
+from typing import List
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import Chroma
+
+from chat_engine import ITHelpdeskChatEngine
+from index_manager import close_vector_store
+from stub_llm import StubChatModel
+
+
+class RecordingChatModel(StubChatModel):
+    """Stub model that keeps every prompt it was sent"""
+
+    prompts: List[str] = []
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append("\n".join(str(message.content) for message in messages))
+        return super()._call(messages, stop, run_manager, **kwargs)
+
+
+def make_engine(tmp_path, metadatas):
+    vector_store = Chroma.from_texts(
+        texts=[f"Restart the VPN client ({i})" for i in range(len(metadatas))],
+        metadatas=metadatas,
+        embedding=FakeEmbeddings(size=8),
+        persist_directory=str(tmp_path / "chroma")
+    )
+    # Fake embeddings score randomly; never fall back to the global search
+    engine = ITHelpdeskChatEngine(
+        vector_store=vector_store,
+        llm=RecordingChatModel(),
+        adaptive_retrieval=False,
+        min_filtered_relevance=float("-inf")
+    )
+    return engine, vector_store
+
+
+@pytest.fixture
+def indexed(tmp_path):
+    metadatas = [{"category": "networking", "os": os, "department": "any", "priority": "high"}
+                 for os in ("macos", "windows", "any")]
+    engine, vector_store = make_engine(tmp_path, metadatas)
+    yield engine
+    close_vector_store(vector_store)
+
+
+@pytest.fixture
+def legacy(tmp_path):
+    # Built before os/department metadata existed
+    engine, vector_store = make_engine(tmp_path, [{"category": "networking", "priority": "high"}] * 3)
+    yield engine
+    close_vector_store(vector_store)
+
+
+def test_structured_context_reaches_the_llm(indexed):
+    indexed.chat("My VPN won't connect", user_context={"os": "macOS", "department": "Finance"})
+
+    [prompt] = indexed.llm.prompts
+    assert "User question: My VPN won't connect" in prompt
+    assert "os: macOS" in prompt and "department: Finance" in prompt
+
+
+def test_structured_context_filters_retrieval(indexed):
+    _, retriever = indexed._build_retrieval("My VPN won't connect", {"os": "macOS"})
+    assert retriever.metadata_filter == {"os": {"$in": ["macos", "any"]}}
+
+    documents = retriever.get_relevant_documents("My VPN won't connect")
+    assert {doc.metadata["os"] for doc in documents} <= {"macos", "any"}
+
+
+def test_index_without_context_fields_is_not_filtered_on_them(legacy):
+    _, retriever = legacy._build_retrieval("My VPN won't connect", {"os": "macOS", "priority": "high"})
+    assert retriever.metadata_filter == {"priority": "high"}
+    assert len(retriever.get_relevant_documents("My VPN won't connect")) == 3
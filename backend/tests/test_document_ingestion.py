@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from document_ingestion import normalize_document_meta, parse_front_matter, split_by_headings
+
+
+def test_split_by_headings_tracks_heading_path():
+    text = "intro\n# Wi-Fi\nconnect\n## macOS\nsteps\n# VPN\nsetup"
+    assert split_by_headings(text) == [
+        ([], "intro"),
+        (["Wi-Fi"], "connect"),
+        (["Wi-Fi", "macOS"], "steps"),
+        (["VPN"], "setup"),
+    ]
+
+
+def test_split_by_headings_ignores_headings_in_code_blocks():
+    text = "# Script\n```\n# not a heading\n```"
+    assert split_by_headings(text) == [(["Script"], "```\n# not a heading\n```")]
+
+
+def test_split_by_headings_skipped_level_keeps_placeholder():
+    assert split_by_headings("### Deep\nbody") == [(["", "", "Deep"], "body")]
+
+
+def test_parse_front_matter():
+    meta, body = parse_front_matter("---\nCategory: Networking\nkeywords: [wifi, 'vpn']\n---\nbody")
+    assert meta == {"category": "Networking", "keywords": "wifi,vpn"}
+    assert body == "body"
+
+
+def test_normalize_document_meta_lowercases_and_validates():
+    assert normalize_document_meta({"category": " Networking ", "priority": "HIGH"}) == {
+        "category": "networking",
+        "priority": "high",
+    }
+    assert normalize_document_meta({"category": "", "priority": "urgent", "os": "mac"}) == {"os": "mac"}
+
+
+def test_directory_ingestor_syncs_changes(tmp_path):
+    chromadb = pytest.importorskip("chromadb")
+    from chromadb.config import Settings
+    from langchain_community.embeddings import FakeEmbeddings
+    from document_ingestion import DirectoryIngestor
+
+    docs = tmp_path / "docs" / "networking"
+    docs.mkdir(parents=True)
+    (docs / "wifi.md").write_text("# Wi-Fi\nForget the network and reconnect")
+    (docs / "vpn.md").write_text("# VPN\nReinstall the client")
+
+    client = chromadb.Client(Settings(is_persistent=True, persist_directory=str(tmp_path / "chroma"),
+                                      anonymized_telemetry=False))
+    collection = client.get_or_create_collection("docs")
+    ingestor = DirectoryIngestor(
+        vector_store=SimpleNamespace(_collection=collection),
+        embeddings=FakeEmbeddings(size=8),
+        persist_directory=str(tmp_path / "chroma"),
+        parse_workers=1
+    )
+
+    stats = ingestor.ingest(str(tmp_path / "docs"))
+    assert (stats["added"], stats["chunks"]) == (2, 2)
+
+    (docs / "vpn.md").unlink()
+    stats = ingestor.ingest(str(tmp_path / "docs"))
+    assert (stats["removed"], stats["unchanged"]) == (1, 1)
+    assert collection.get(include=["metadatas"])["metadatas"][0]["category"] == "networking"
+    assert collection.count() == 1
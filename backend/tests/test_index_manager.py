@@ -0,0 +1,150 @@
+import asyncio
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+from chromadb.api.client import SharedSystemClient
+from chromadb.config import Settings
+
+from index_manager import IndexManager, close_vector_store
+
+
+def open_store(path):
+    client = chromadb.Client(Settings(is_persistent=True, persist_directory=str(path), anonymized_telemetry=False))
+    # Same shape as langchain's Chroma wrapper
+    return SimpleNamespace(_client=client, _collection=client.get_or_create_collection("test"))
+
+
+def seed(store):
+    store._collection.add(ids=["a", "b"], embeddings=[[0.0, 1.0], [1.0, 0.0]], documents=["a", "b"])
+
+
+def test_closed_store_directory_can_be_replaced(tmp_path):
+    path = tmp_path / "index"
+    store = open_store(path)
+    seed(store)
+
+    assert close_vector_store(store)
+
+    # Without closing, chromadb would hand back the old System: stale
+    # contents and "readonly database" errors on the deleted files
+    shutil.rmtree(path)
+    fresh = open_store(path)
+    assert fresh._collection.count() == 0
+    seed(fresh)
+    assert fresh._collection.count() == 2
+
+
+def test_closed_store_reopens_from_disk(tmp_path):
+    store = open_store(tmp_path / "index")
+    seed(store)
+    assert close_vector_store(store)
+
+    assert open_store(tmp_path / "index")._collection.count() == 2
+
+
+def test_close_vector_store_does_not_stop_system_without_cache(monkeypatch):
+    stopped = []
+    store = SimpleNamespace(_client=SimpleNamespace(_system=SimpleNamespace(stop=lambda: stopped.append(True))))
+
+    # A chromadb without the System cache: stopping would leave it handing
+    # out a dead System for the directory
+    monkeypatch.delattr(SharedSystemClient, "_identifer_to_system")
+    assert close_vector_store(store) is False
+    assert stopped == []
+
+
+def test_close_vector_store_ignores_non_chroma_and_closed_stores(tmp_path):
+    assert close_vector_store(None) is False
+    assert close_vector_store(SimpleNamespace()) is False
+
+    store = open_store(tmp_path / "index")
+    assert close_vector_store(store)
+    assert close_vector_store(store) is False
+
+
+class FakeLoader:
+    def __init__(self, persist_directory, csv_path="", docs_directory=None):
+        self.persist_directory = persist_directory
+        self.csv_path = csv_path
+        self.docs_directory = docs_directory
+        self.vector_store = None
+
+    def initialize(self, force_reload=False):
+        store = open_store(self.persist_directory)
+        seed(store)
+        return store
+
+
+def make_manager(tmp_path, **loader_options):
+    return IndexManager(
+        FakeLoader(str(tmp_path / "base"), **loader_options),
+        loader_factory=lambda directory: FakeLoader(directory),
+        calibration_samples=0
+    )
+
+
+def test_reload_releases_initial_version_but_keeps_its_directory(tmp_path):
+    manager = make_manager(tmp_path)
+    initial = manager.initialize()
+    assert not initial.managed
+
+    asyncio.run(manager.reload())
+
+    assert initial.vector_store is None
+    assert (tmp_path / "base").exists()
+    # Released: the base directory can be replaced and reopened cleanly
+    shutil.rmtree(tmp_path / "base")
+    assert open_store(tmp_path / "base")._collection.count() == 0
+    manager.close()
+
+
+def test_sources_fingerprint_notices_renames_and_older_mtimes(tmp_path):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "wifi.md").write_text("# Wi-Fi")
+    manager = make_manager(tmp_path, docs_directory=str(docs))
+
+    original = manager.sources_fingerprint()
+    assert manager.sources_fingerprint() == original
+
+    (docs / "wifi.md").rename(docs / "wireless.md")
+    renamed = manager.sources_fingerprint()
+    assert renamed != original
+
+    stat = os.stat(docs / "wireless.md")
+    os.utime(docs / "wireless.md", ns=(stat.st_atime_ns, stat.st_mtime_ns - 10**9))
+    assert manager.sources_fingerprint() != renamed
+
+
+def test_watch_does_not_rebuild_failing_sources_every_poll(tmp_path):
+    csv_path = tmp_path / "kb.csv"
+    csv_path.write_text("category,issue\n")
+    builds = []
+
+    class BrokenLoader(FakeLoader):
+        def initialize(self, force_reload=False):
+            builds.append(self.persist_directory)
+            raise ValueError("malformed CSV")
+
+    manager = IndexManager(
+        FakeLoader(str(tmp_path / "base"), csv_path=str(csv_path)),
+        loader_factory=BrokenLoader,
+        calibration_samples=0
+    )
+    manager.initialize()
+
+    async def scenario():
+        watcher = asyncio.create_task(manager.watch(0.01))
+        await asyncio.sleep(0.05)
+        csv_path.write_text("category,issue\nnetworking,\"broken\n")
+        await asyncio.sleep(0.2)
+        watcher.cancel()
+
+    asyncio.run(scenario())
+    assert len(builds) == 1
+    assert manager.status()["last_error"] == "malformed CSV"
+    manager.close()
@@ -0,0 +1,19 @@
+import math
+
+from ingestion import build_csv_document
+
+ROW = {"category": "networking", "issue": "vpn", "solution": "Reinstall", "keywords": "vpn", "priority": "high"}
+
+
+def test_csv_rows_apply_to_everyone_by_default():
+    metadata = build_csv_document(ROW, 0).metadata
+    assert (metadata["os"], metadata["department"]) == ("any", "any")
+
+    # Empty cells in an optional column come back from pandas as NaN
+    metadata = build_csv_document({**ROW, "os": math.nan, "department": " "}, 0).metadata
+    assert (metadata["os"], metadata["department"]) == ("any", "any")
+
+
+def test_csv_rows_can_target_an_os_or_department():
+    metadata = build_csv_document({**ROW, "os": " macOS ", "department": "Finance"}, 0).metadata
+    assert (metadata["os"], metadata["department"]) == ("macos", "finance")
@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("chromadb")
+from langchain_community.embeddings import FakeEmbeddings
+
+import knowledge_base
+from index_manager import close_vector_store
+
+HEADER = "category,issue,solution,keywords,priority\n"
+
+
+def write_csv(path, issues):
+    path.write_text(HEADER + "".join(f"networking,{issue},Restart it,{issue},high\n" for issue in issues))
+
+
+@pytest.fixture
+def loader(tmp_path, monkeypatch):
+    monkeypatch.setattr(knowledge_base, "OpenAIEmbeddings", lambda: FakeEmbeddings(size=8))
+    loader = knowledge_base.KnowledgeBaseLoader(
+        csv_path=str(tmp_path / "kb.csv"),
+        persist_directory=str(tmp_path / "chroma"),
+        streaming=True,
+        ingest_options={"rows_per_block": 2, "parse_workers": 1}
+    )
+    yield loader
+    close_vector_store(loader.vector_store)
+
+
+def test_force_reload_drops_chunks_of_deleted_rows(tmp_path, loader):
+    write_csv(tmp_path / "kb.csv", ["wifi", "vpn", "printer"])
+    assert loader.initialize()._collection.count() == 3
+
+    write_csv(tmp_path / "kb.csv", ["wifi"])
+    vector_store = loader.initialize(force_reload=True)
+
+    assert vector_store._collection.count() == 1
+    assert vector_store._collection.get(include=["metadatas"])["metadatas"][0]["issue"] == "wifi"
+
+
+def test_force_reload_reingests_unchanged_csv(tmp_path, loader):
+    write_csv(tmp_path / "kb.csv", ["wifi", "vpn"])
+    loader.initialize()._collection.delete(ids=["kb-1-0"])
+
+    # A completed checkpoint for the same CSV must not turn this into a no-op
+    assert loader.initialize(force_reload=True)._collection.count() == 2
@@ -0,0 +1,136 @@
+import asyncio
+import gc
+import threading
+
+from prefetch import PrefetchScheduler, RetrievalCache, normalize_query
+
+
+class Store:
+    """Stands in for a vector store (the cache only holds weak references)"""
+
+
+def test_normalize_query():
+    assert normalize_query("  How do I  reset my PASSWORD?? ") == "how do i reset my password"
+
+
+def test_cache_hits_on_normalized_query_for_same_store():
+    cache = RetrievalCache()
+    store = Store()
+    cache.put_results(store, "VPN not connecting?", {"category": "networking"}, 3, [("doc", 0.9)])
+
+    assert cache.get_results(store, "vpn not connecting", {"category": "networking"}, 3) == [("doc", 0.9)]
+    assert cache.get_results(store, "vpn not connecting", None, 3) is None
+    assert cache.get_results(Store(), "vpn not connecting", {"category": "networking"}, 3) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_cache_does_not_keep_stores_alive():
+    cache = RetrievalCache()
+    store = Store()
+    cache.put_results(store, "vpn not connecting", None, 3, [("doc", 0.9)])
+
+    del store
+    gc.collect()
+    # Dead stores' results are dropped on the next discard
+    live = Store()
+    cache.put_results(live, "printer offline", None, 3, [("doc", 0.5)])
+    cache.discard(Store())
+    assert cache.stats()["results"] == 1
+
+    cache.discard(live)
+    assert cache.stats()["results"] == 0
+
+
+def test_cache_prefetch_lookups_are_not_counted():
+    cache = RetrievalCache()
+    assert cache.get_results(Store(), "printer offline", None, 3, count=False) is None
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_cache_expires_and_evicts_least_recently_used():
+    expired = RetrievalCache(ttl_seconds=-1)
+    expired.put_embedding("printer offline", [0.1])
+    assert expired.get_embedding("printer offline") is None
+
+    cache = RetrievalCache(max_entries=2)
+    cache.put_embedding("a", [1.0])
+    cache.put_embedding("b", [2.0])
+    cache.get_embedding("a")
+    cache.put_embedding("c", [3.0])
+    assert cache.get_embedding("b") is None
+    assert cache.get_embedding("a") == [1.0]
+    assert cache.stats()["embeddings"] == 2
+
+
+async def _wait_idle(scheduler):
+    tasks = [s.task for s in scheduler._conversations.values() if s.task is not None]
+    await asyncio.gather(*tasks)
+
+
+def test_scheduler_suppresses_duplicates_and_rate_limits_per_draft():
+    async def scenario():
+        scheduler = PrefetchScheduler(min_interval=60)
+        results = [
+            scheduler.submit("t:draft-1", "vpn not connecting", lambda is_stale: None),
+            scheduler.submit("t:draft-1", "vpn not connecting", lambda is_stale: None),
+            scheduler.submit("t:draft-1", "vpn not connecting at home", lambda is_stale: None),
+            # Another tab (even from the same address) is not held back
+            scheduler.submit("t:draft-2", "printer offline again", lambda is_stale: None),
+        ]
+        await _wait_idle(scheduler)
+        return results, scheduler.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == ["scheduled", "duplicate", "rate_limited", "scheduled"]
+    assert stats["running"] == 0
+    assert stats["conversations"] == 2
+
+
+def test_scheduler_marks_older_prefetch_stale():
+    started = threading.Event()
+    release = threading.Event()
+    seen = {}
+
+    def slow(is_stale):
+        started.set()
+        release.wait(5)
+        seen["first"] = is_stale()
+
+    def fast(is_stale):
+        seen["second"] = is_stale()
+
+    async def scenario():
+        scheduler = PrefetchScheduler(min_interval=0)
+        assert scheduler.submit("t:draft", "vpn not connecting", slow) == "scheduled"
+        await asyncio.to_thread(started.wait, 5)
+        assert scheduler.submit("t:draft", "vpn not connecting at home", fast) == "scheduled"
+        release.set()
+        await _wait_idle(scheduler)
+        return scheduler.stats()
+
+    stats = asyncio.run(scenario())
+    assert seen == {"first": True, "second": False}
+    assert stats["cancelled"] == 1
+    assert stats["running"] == 0
+
+
+def test_scheduler_drops_work_when_busy_and_survives_failures():
+    release = threading.Event()
+
+    def blocked(is_stale):
+        release.wait(5)
+        raise RuntimeError("embedding service down")
+
+    async def scenario():
+        scheduler = PrefetchScheduler(min_interval=0, max_concurrent=1)
+        first = scheduler.submit("t:draft-1", "vpn not connecting", blocked)
+        second = scheduler.submit("t:draft-2", "printer offline again", lambda is_stale: None)
+        release.set()
+        await _wait_idle(scheduler)
+        third = scheduler.submit("t:draft-2", "printer offline again", lambda is_stale: None)
+        await _wait_idle(scheduler)
+        return [first, second, third], scheduler.stats()
+
+    results, stats = asyncio.run(scenario())
+    assert results == ["scheduled", "busy", "scheduled"]
+    assert stats["running"] == 0
@@ -0,0 +1,36 @@
+import os
+
+from profiling import RequestProfiler
+
+
+def profile_once(profiler, label="chat"):
+    with profiler.profile(label) as result:
+        sum(range(1000))
+    return result
+
+
+def test_profile_is_saved_with_headers(tmp_path):
+    profiler = RequestProfiler(output_dir=str(tmp_path))
+    result = profile_once(profiler)
+
+    assert os.path.exists(result.path)
+    assert result.headers["X-Profile-Id"] == result.profile_id
+    assert result.top_frames
+
+
+def test_only_newest_profiles_are_kept(tmp_path):
+    profiler = RequestProfiler(output_dir=str(tmp_path), max_files=2)
+    paths = []
+    for age in range(4):
+        paths.append(profile_once(profiler).path)
+        # Make each profile older than the next regardless of clock resolution
+        os.utime(paths[-1], (age, age))
+
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in paths[-2:])
+
+
+def test_should_profile_requires_matching_token(tmp_path):
+    profiler = RequestProfiler(output_dir=str(tmp_path), token="secret")
+    assert profiler.should_profile({"x-profile": "1", "x-profile-token": "secret"})
+    assert not profiler.should_profile({"x-profile": "1", "x-profile-token": "wrong"})
+    assert not profiler.should_profile({})
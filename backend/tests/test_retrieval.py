@@ -0,0 +1,150 @@
+import math
+
+import pytest
+
+from retrieval import (
+    MAX_CALIBRATED_SLOPE,
+    ConfidenceCalibration,
+    adaptive_depth,
+    build_metadata_filter,
+    calibrate_confidence,
+    retrieval_confidence,
+)
+
+
+def test_build_metadata_filter_no_context():
+    assert build_metadata_filter() == (None, {})
+
+
+def test_build_metadata_filter_single_condition():
+    assert build_metadata_filter("networking") == ({"category": "networking"}, {})
+
+
+def test_build_metadata_filter_wildcards_and_free_text():
+    metadata_filter, remaining = build_metadata_filter(
+        None, {"OS": " MacOS ", "priority": "High", "location": "HQ"}
+    )
+    assert metadata_filter == {"$and": [
+        {"os": {"$in": ["macos", "any"]}},
+        {"priority": "high"},
+    ]}
+    assert remaining == {"location": "HQ"}
+
+
+def test_build_metadata_filter_explicit_category_wins():
+    metadata_filter, _ = build_metadata_filter("password", {"category": "networking"})
+    assert metadata_filter == {"category": "password"}
+
+
+def test_build_metadata_filter_skips_fields_missing_from_index():
+    metadata_filter, remaining = build_metadata_filter(
+        "networking", {"os": "macos", "priority": "high"}, indexed_fields={"category", "priority"}
+    )
+    assert metadata_filter == {"$and": [{"category": "networking"}, {"priority": "high"}]}
+    assert remaining == {"os": "macos"}
+
+
+def test_retrieval_confidence_midpoint_is_half():
+    calibration = ConfidenceCalibration(midpoint=0.6, slope=10)
+    assert retrieval_confidence([0.6], calibration) == pytest.approx(0.5)
+    assert retrieval_confidence([], calibration) == 0.0
+
+
+def test_retrieval_confidence_rewards_margin():
+    calibration = ConfidenceCalibration(midpoint=0.6, slope=10)
+    clear = retrieval_confidence([0.7, 0.4], calibration)
+    close = retrieval_confidence([0.7, 0.69], calibration)
+    assert clear > close > 0.5
+
+
+def test_adaptive_depth():
+    assert adaptive_depth([], 0.9) == 0
+    # One dominant article
+    assert adaptive_depth([0.9, 0.6, 0.5], 0.9) == 1
+    # Several equally good ones
+    assert adaptive_depth([0.9, 0.88, 0.87, 0.5], 0.9) == 3
+    # Low confidence widens to max_k
+    assert adaptive_depth([0.5, 0.3, 0.2, 0.1], 0.2, max_k=3) == 3
+
+
+class FakeEmbeddings:
+    """Titles embed as [1, 0]; text still containing its title matches it
+    perfectly, text without it scores 0.8 (inner product space)"""
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[1.0, 0.0] if "vpn issue" in text.lower() else [0.8, 0.0] for text in texts]
+
+
+class FakeCollection:
+    """Each doc's best other-document result scores ``near_miss``"""
+
+    metadata = {"hnsw:space": "ip"}
+
+    def __init__(self, docs, near_miss=0.5):
+        self.docs = docs
+        self.near_miss = near_miss
+
+    def get(self, limit, include):
+        return {
+            "metadatas": [{"issue": f"vpn_issue_{i}", "doc_id": i} for i in range(self.docs)][:limit],
+            "documents": [f"Issue: vpn_issue_{i}\nReinstall the client" for i in range(self.docs)][:limit],
+        }
+
+    def query(self, query_embeddings, n_results, include):
+        return {
+            "metadatas": [[{"doc_id": -1}] for _ in query_embeddings],
+            "distances": [[1.0 - self.near_miss] for _ in query_embeddings],
+        }
+
+
+class FakeVectorStore:
+    def __init__(self, docs, near_miss=0.5):
+        self._collection = FakeCollection(docs, near_miss)
+        self.embeddings = FakeEmbeddings()
+
+    def _select_relevance_score_fn(self):
+        return lambda distance: 1.0 - distance
+
+
+def test_calibrate_confidence_fits_collection_scores():
+    vector_store = FakeVectorStore(docs=10)
+    calibration = calibrate_confidence(vector_store, target_confidence=0.9)
+
+    # Matched against the chunk without its title: 0.8, not a perfect 1.0
+    assert not any("vpn_issue" in text.lower() for text in vector_store.embeddings.texts[10:])
+    assert calibration.midpoint == pytest.approx(0.65)
+    # A typical good match (0.8, no runner-up) lands at the target confidence
+    assert retrieval_confidence([0.8], calibration) == pytest.approx(0.9)
+
+
+def test_calibrate_confidence_needs_enough_samples():
+    assert calibrate_confidence(FakeVectorStore(docs=3)) is None
+
+
+def test_calibrate_confidence_caps_slope():
+    calibration = calibrate_confidence(FakeVectorStore(docs=10, near_miss=0.785))
+    assert calibration.slope == MAX_CALIBRATED_SLOPE
+
+
+def test_retrieval_confidence_survives_extreme_scores():
+    calibration = ConfidenceCalibration(midpoint=0.65, slope=MAX_CALIBRATED_SLOPE)
+    assert retrieval_confidence([-1e6, -1e6 - 1], calibration) == pytest.approx(0.0)
+    assert retrieval_confidence([1e6], calibration) == pytest.approx(1.0)
+
+
+def test_calibration_rejects_invalid_slope():
+    for slope in (0.0, -3.0, math.inf, math.nan):
+        with pytest.raises(ValueError):
+            ConfidenceCalibration(slope=slope)
+
+
+def test_relevance_window_follows_slope():
+    assert ConfidenceCalibration().relevance_window == pytest.approx(0.05)
+    # A steeper index separates scores more finely, so ties are narrower
+    steep = ConfidenceCalibration(slope=48.0)
+    assert steep.relevance_window == pytest.approx(0.0125)
+    assert adaptive_depth([0.9, 0.88, 0.87], 0.9, relevance_window=steep.relevance_window) == 1
@@ -0,0 +1,115 @@
+import shutil
+
+import pytest
+
+chromadb = pytest.importorskip("chromadb")
+from chromadb.config import Settings
+
+from chat_engine import ITHelpdeskChatEngine
+from prefetch import RetrievalCache
+from stub_llm import StubChatModel
+from tenants import TenantPool, TenantRuntime
+
+
+class FakeLoader:
+    """Stands in for KnowledgeBaseLoader: a small persistent chroma index"""
+
+    def __init__(self, persist_directory):
+        self.persist_directory = persist_directory
+        self.csv_path = ""
+        self.docs_directory = None
+        self.vector_store = None
+
+    def initialize(self, force_reload=False):
+        store = open_store(self.persist_directory)
+        store._collection.upsert(ids=["a"], embeddings=[[0.0, 1.0]], documents=["a"])
+        return store
+
+
+class Store:
+    """The parts of a langchain Chroma store the index manager touches"""
+
+    def __init__(self, client):
+        self._client = client
+        self._collection = client.get_or_create_collection("test")
+
+
+def open_store(path):
+    return Store(chromadb.Client(Settings(is_persistent=True, persist_directory=str(path), anonymized_telemetry=False)))
+
+
+def make_pool(tmp_path, retrieval_cache=None):
+    configs = {
+        name: {"persist_directory": str(tmp_path / name)}
+        for name in ("alpha", "beta")
+    }
+    default = TenantRuntime("default", {})
+    return TenantPool(
+        default_runtime=default,
+        configs=configs,
+        loader_factory=lambda directory, config: FakeLoader(directory),
+        engine_factory=lambda vector_store, config: ITHelpdeskChatEngine(
+            vector_store=vector_store, llm=StubChatModel(), retrieval_cache=retrieval_cache
+        ),
+        memory_budget_bytes=1,
+        index_options={"calibration_samples": 0}
+    )
+
+
+def test_eviction_releases_chroma_system(tmp_path):
+    pool = make_pool(tmp_path)
+
+    pool.ensure_loaded("alpha")
+
+    # Over budget: loading beta evicts the idle alpha
+    pool.ensure_loaded("beta")
+
+    assert pool.status()["loaded"] == ["beta"]
+    assert pool.evictions == 1
+    assert pool._runtimes["alpha"].chat_engine.vector_store is None
+
+    # chromadb no longer holds alpha's index: its directory can be replaced
+    # and reopened without stale contents or readonly-database errors
+    shutil.rmtree(tmp_path / "alpha")
+    store = open_store(tmp_path / "alpha")
+    assert store._collection.count() == 0
+    store._collection.add(ids=["b"], embeddings=[[1.0, 0.0]], documents=["b"])
+
+
+def test_ensure_loaded_counts_hits_and_loads(tmp_path):
+    pool = make_pool(tmp_path)
+    pool.ensure_loaded("alpha")
+    pool.ensure_loaded("alpha")
+    assert (pool.loads, pool.hits) == (1, 1)
+
+
+def test_eviction_drops_cached_results(tmp_path):
+    cache = RetrievalCache()
+    pool = make_pool(tmp_path, retrieval_cache=cache)
+
+    pool.ensure_loaded("alpha")
+    store = pool._runtimes["alpha"].chat_engine.vector_store
+    cache.put_results(store, "vpn not connecting", None, 3, [("doc", 0.9)])
+
+    pool.ensure_loaded("beta")
+    assert cache.stats()["results"] == 0
+
+
+def test_acquire_if_loaded_never_loads(tmp_path):
+    pool = make_pool(tmp_path)
+
+    with pool.acquire_if_loaded("alpha") as pinned:
+        assert pinned is None
+    assert pool.loads == 0
+
+    pool.ensure_loaded("alpha")
+    pool.ensure_loaded("beta")
+    # alpha was evicted; a prefetch must not page it back in
+    with pool.acquire_if_loaded("alpha") as pinned:
+        assert pinned is None
+    assert pool.status()["loaded"] == ["beta"]
+
+    with pool.acquire_if_loaded("beta") as (engine, version):
+        assert version.vector_store is engine.vector_store
+        assert pool._runtimes["beta"].index_manager.in_flight
+    assert not pool._runtimes["beta"].index_manager.in_flight
@@ -0,0 +1,49 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from ticket_store import TicketStore
+
+
+OUTAGE = [1.0, 0.0, 0.0]
+UNRELATED = [0.0, 1.0, 0.0]
+
+
+def make_store(tmp_path):
+    vectors = {"VPN is down for everyone": OUTAGE, "VPN down again": OUTAGE, "Printer jam": UNRELATED}
+    return TicketStore(db_path=str(tmp_path / "tickets.db"), embed_fn=vectors.__getitem__)
+
+
+def test_duplicate_joins_open_incident(tmp_path):
+    store = make_store(tmp_path)
+    root = store.create("VPN is down for everyone", "networking", "high")
+    duplicate = store.create("VPN down again", "networking", "high")
+    other = store.create("Printer jam", "hardware", "low")
+
+    assert duplicate["incident_id"] == root["ticket_id"]
+    assert other["incident_id"] == other["ticket_id"]
+
+
+def test_duplicate_joins_incident_in_progress(tmp_path):
+    store = make_store(tmp_path)
+    root = store.create("VPN is down for everyone", "networking", "high")
+    assert store.update_status(root["ticket_id"], "in_progress")
+
+    duplicate = store.create("VPN down again", "networking", "high")
+    assert duplicate["incident_id"] == root["ticket_id"]
+
+
+def test_resolved_incident_does_not_attract_duplicates(tmp_path):
+    store = make_store(tmp_path)
+    root = store.create("VPN is down for everyone", "networking", "high")
+    store.update_status(root["ticket_id"], "resolved")
+
+    ticket = store.create("VPN down again", "networking", "high")
+    assert ticket["incident_id"] == ticket["ticket_id"]
+
+
+def test_update_status_rejects_unknown_status(tmp_path):
+    store = make_store(tmp_path)
+    root = store.create("Printer jam", "hardware", "low")
+    with pytest.raises(ValueError):
+        store.update_status(root["ticket_id"], "done")
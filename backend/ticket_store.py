@@ -0,0 +1,246 @@
+"""
+Persistent support ticket store with idempotency and duplicate-incident detection
+"""
+import sqlite3
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Callable, Any
+import numpy as np
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    ticket_id TEXT PRIMARY KEY,
+    conversation_id TEXT UNIQUE,
+    incident_id TEXT NOT NULL,
+    issue_description TEXT NOT NULL,
+    category TEXT NOT NULL,
+    priority TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'open',
+    user_email TEXT,
+    user_name TEXT,
+    created_at TEXT NOT NULL,
+    embedding BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_tickets_status_category_priority
+    ON tickets (status, category, priority);
+CREATE INDEX IF NOT EXISTS idx_tickets_status_created
+    ON tickets (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_tickets_incident
+    ON tickets (incident_id);
+"""
+
+TICKET_STATUSES = ("open", "in_progress", "resolved", "closed")
+
+# Tickets still being worked on take part in duplicate-incident detection
+ACTIVE_TICKET_STATUSES = ("open", "in_progress")
+
+TICKET_COLUMNS = [
+    "ticket_id",
+    "conversation_id",
+    "incident_id",
+    "issue_description",
+    "category",
+    "priority",
+    "status",
+    "user_email",
+    "user_name",
+    "created_at",
+]
+
+
+class TicketStore:
+    """SQLite (WAL) ticket store that groups near-identical tickets into incidents"""
+
+    def __init__(
+        self,
+        db_path: str = "./tickets.db",
+        embed_fn: Optional[Callable[[str], List[float]]] = None,
+        duplicate_window_minutes: int = 30,
+        duplicate_threshold: float = 0.9
+    ):
+        self.db_path = db_path
+        self.embed_fn = embed_fn
+        self.duplicate_window_minutes = duplicate_window_minutes
+        self.duplicate_threshold = duplicate_threshold
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+        # Serializes access to the shared connection, and the read-compare-insert
+        # sequence so concurrent duplicates always see each other
+        self._lock = threading.RLock()
+
+    def _row_to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        """Convert a row to a plain dict, omitting the embedding blob"""
+        return {column: row[column] for column in TICKET_COLUMNS}
+
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Embed text as a unit-length float32 vector"""
+        if self.embed_fn is None:
+            return None
+
+        try:
+            vector = np.asarray(self.embed_fn(text), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"Could not embed ticket description, skipping duplicate check: {str(e)}")
+            return None
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _find_similar_incident(self, embedding: np.ndarray) -> Optional[str]:
+        """Compare against recent active tickets in a single matrix product"""
+        cutoff = (datetime.utcnow() - timedelta(minutes=self.duplicate_window_minutes)).isoformat()
+
+        rows = self._conn.execute(
+            "SELECT incident_id, embedding FROM tickets "
+            f"WHERE status IN ({', '.join('?' for _ in ACTIVE_TICKET_STATUSES)}) "
+            "AND created_at >= ? AND embedding IS NOT NULL",
+            (*ACTIVE_TICKET_STATUSES, cutoff)
+        ).fetchall()
+
+        candidates = [
+            (row["incident_id"], np.frombuffer(row["embedding"], dtype=np.float32))
+            for row in rows
+        ]
+        candidates = [(incident, vec) for incident, vec in candidates if vec.shape == embedding.shape]
+        if not candidates:
+            return None
+
+        matrix = np.vstack([vec for _, vec in candidates])
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+
+        if similarities[best] >= self.duplicate_threshold:
+            logger.info(f"Ticket matches incident {candidates[best][0]} (similarity {similarities[best]:.3f})")
+            return candidates[best][0]
+
+        return None
+
+    def get_by_conversation(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        """Look up the ticket already filed for a conversation"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM tickets WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def create(
+        self,
+        issue_description: str,
+        category: str,
+        priority: str,
+        user_email: Optional[str] = None,
+        user_name: Optional[str] = None,
+        conversation_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Create a ticket, or return the existing one for this conversation.
+
+        Returns the ticket dict with an extra ``created`` flag that is False
+        when the idempotency key matched an existing ticket.
+        """
+        if conversation_id:
+            existing = self.get_by_conversation(conversation_id)
+            if existing:
+                return {**existing, "created": False}
+
+        embedding = self._embed(issue_description)
+
+        with self._lock:
+            if conversation_id:
+                existing = self.get_by_conversation(conversation_id)
+                if existing:
+                    return {**existing, "created": False}
+
+            ticket_id = f"TKT-{str(uuid.uuid4())[:8].upper()}"
+            incident_id = None
+            if embedding is not None:
+                incident_id = self._find_similar_incident(embedding)
+
+            ticket = {
+                "ticket_id": ticket_id,
+                "conversation_id": conversation_id,
+                "incident_id": incident_id or ticket_id,
+                "issue_description": issue_description,
+                "category": category,
+                "priority": priority.lower(),
+                "status": "open",
+                "user_email": user_email,
+                "user_name": user_name,
+                "created_at": datetime.utcnow().isoformat(),
+            }
+
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT INTO tickets ({', '.join(TICKET_COLUMNS)}, embedding) "
+                    f"VALUES ({', '.join('?' for _ in TICKET_COLUMNS)}, ?)",
+                    [ticket[column] for column in TICKET_COLUMNS]
+                    + [embedding.tobytes() if embedding is not None else None]
+                )
+
+        return {**ticket, "created": True}
+
+    def get(self, ticket_id: str) -> Optional[Dict[str, Any]]:
+        """Get a ticket by ID"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM tickets WHERE ticket_id = ?",
+                (ticket_id,)
+            ).fetchone()
+        return self._row_to_dict(row) if row else None
+
+    def list_tickets(
+        self,
+        status: Optional[str] = None,
+        category: Optional[str] = None,
+        priority: Optional[str] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """List tickets filtered by status/category/priority"""
+        clauses = []
+        params: List[Any] = []
+        for column, value in (("status", status), ("category", category), ("priority", priority)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM tickets {where} ORDER BY created_at DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+
+        return [self._row_to_dict(row) for row in rows]
+
+    def update_status(self, ticket_id: str, status: str) -> bool:
+        """Update a ticket's status; False if the ticket doesn't exist"""
+        if status not in TICKET_STATUSES:
+            raise ValueError(f"status must be one of {list(TICKET_STATUSES)}")
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE tickets SET status = ? WHERE ticket_id = ?",
+                (status, ticket_id)
+            )
+        return cursor.rowcount > 0
+
+    def close(self):
+        """Close the database connection"""
+        self._conn.close()
@@ -0,0 +1,123 @@
+"""
+Sanitized capture of /chat and /quick-action traffic for replay
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Any
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+SECRET_KEYWORDS = r"(?:password|passwd|pwd|passcode|passphrase|pin|token|secret|api[_ -]?key|access[_ -]?key)"
+
+# Order matters: token shapes before the generic number rule, which would
+# otherwise only mask their digits
+REDACTIONS = [
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    # JWTs and Authorization header values
+    (re.compile(r"\beyJ[\w-]+\.[\w-]+\.[\w-]*"), "<token>"),
+    (re.compile(r"(?i)\b(bearer|basic)\s+[\w.~+/-]+=*"), r"\1 <token>"),
+    # Vendor key shapes (OpenAI, GitHub, Slack, AWS access key IDs)
+    (re.compile(r"\b(?:sk|pk|rk|ghp|gho|ghs|xox[abpr])[-_][\w-]{8,}"), "<token>"),
+    (re.compile(r"\bAKIA[0-9A-Z]{16}\b"), "<token>"),
+    # "password is x", "pwd: x" - anything after an explicit separator
+    (re.compile(rf"(?i)\b({SECRET_KEYWORDS})(\s*(?:is|was|:|=)\s*)\S+"), r"\1\2<secret>"),
+    # "passwd abc123", "pin 4821" - a value that looks like a secret (has a
+    # digit or symbol), so "reset my password please" is left alone
+    (re.compile(rf"(?i)\b({SECRET_KEYWORDS})(\s+)(?=\S*[\d!@#$%^&*])\S{{4,}}"), r"\1\2<secret>"),
+    # Long high-entropy strings mixing letters and digits (keys, hashes, IDs)
+    (re.compile(r"\b(?=[\w+/-]*\d)(?=[\w+/-]*[A-Za-z])[\w+/-]{24,}={0,2}"), "<token>"),
+    (re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b"), "<ip>"),
+    (re.compile(r"\+?\d[\d\s().-]{7,}\d"), "<number>"),
+]
+
+
+def sanitize_text(text: str) -> str:
+    """Redact emails, credentials and tokens, IPs and phone/account numbers"""
+    for pattern, replacement in REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class TrafficRecorder:
+    """
+    Appends one JSON line per request to an append-only trace file.
+
+    Each line keeps the arrival offset (seconds since capture start), the
+    endpoint and its sanitized inputs, and a keyed hash of the conversation
+    so turns can be regrouped on replay without storing real IDs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._salt = os.urandom(16)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.recorded = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._file = open(path, "a", buffering=1, encoding="utf-8")
+        self._write({"type": "capture_start", "started_at": datetime.utcnow().isoformat()})
+        logger.info(f"Capturing traffic to {path}")
+
+    def _pseudonym(self, conversation_id: Optional[str]) -> Optional[str]:
+        if not conversation_id:
+            return None
+        return hmac.new(self._salt, conversation_id.encode(), hashlib.sha256).hexdigest()[:16]
+
+    def _write(self, record: Dict[str, Any]):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def arrival(self) -> float:
+        """Arrival offset to pass back into ``record()``"""
+        return time.monotonic() - self._started
+
+    def record(
+        self,
+        endpoint: str,
+        arrived_at: float,
+        request_conversation_id: Optional[str],
+        response_conversation_id: Optional[str],
+        message: Optional[str] = None,
+        action_id: Optional[str] = None,
+        user_context: Optional[Dict[str, Any]] = None,
+        tenant_id: Optional[str] = None,
+        duration_ms: Optional[float] = None
+    ):
+        """Append one sanitized, successfully answered request"""
+        try:
+            self._write({
+                "type": "request",
+                "endpoint": endpoint,
+                "t": round(arrived_at, 4),
+                "conversation": self._pseudonym(request_conversation_id),
+                "response_conversation": self._pseudonym(response_conversation_id),
+                "message": sanitize_text(message) if message else None,
+                "action_id": action_id,
+                "user_context": {
+                    key: sanitize_text(value) if isinstance(value, str) else value
+                    for key, value in (user_context or {}).items()
+                },
+                "tenant_id": tenant_id,
+                "duration_ms": round(duration_ms, 1) if duration_ms is not None else None
+            })
+            self.recorded += 1
+        except Exception as e:
+            # Capture must never affect the request being served
+            logger.error(f"Error capturing request: {str(e)}")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
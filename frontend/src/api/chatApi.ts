@@ -1,10 +1,16 @@
 import axios, { AxiosInstance } from 'axios';
-import type { ChatRequest, ChatResponse, QuickAction, TicketRequest, TicketResponse } from '../types';
+import type { AnalyticsEvent, ChatRequest, ChatResponse, PrefetchRequest, QuickAction, TicketRequest, TicketResponse } from '../types';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
+// Analytics events are buffered and sent in batches instead of one request each
+const ANALYTICS_BATCH_SIZE = 20;
+const ANALYTICS_FLUSH_INTERVAL_MS = 5000;
+
 class ChatAPI {
   private client: AxiosInstance;
+  private analyticsBuffer: AnalyticsEvent[] = [];
+  private analyticsTimer: ReturnType<typeof setTimeout> | null = null;
 
   constructor() {
     this.client = axios.create({
@@ -14,6 +20,14 @@ class ChatAPI {
         'Content-Type': 'application/json',
       },
     });
+
+    // Whatever is still buffered when the tab is hidden or closed would be lost
+    if (typeof window !== 'undefined') {
+      document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'hidden') this.flushAnalyticsOnUnload();
+      });
+      window.addEventListener('pagehide', () => this.flushAnalyticsOnUnload());
+    }
   }
 
   async sendMessage(request: ChatRequest): Promise<ChatResponse> {
@@ -21,6 +35,15 @@ class ChatAPI {
     return response.data;
   }
 
+  async prefetch(request: PrefetchRequest): Promise<void> {
+    try {
+      // Best effort: the backend only warms its retrieval cache
+      await this.client.post('/prefetch', request, { timeout: 2000 });
+    } catch (error) {
+      console.debug('Prefetch skipped:', error);
+    }
+  }
+
   async getQuickActions(): Promise<QuickAction[]> {
     const response = await this.client.get<QuickAction[]>('/quick-actions');
     return response.data;
@@ -41,11 +64,59 @@ class ChatAPI {
     await this.client.delete(`/conversation/${conversationId}`);
   }
 
-  async getConversationHistory(conversationId: string): Promise<any> {
-    const response = await this.client.get(`/conversation/${conversationId}/history`);
+  async getConversationHistory(
+    conversationId: string,
+    params: { limit?: number; before?: number; after?: number } = {}
+  ): Promise<any> {
+    const response = await this.client.get(`/conversation/${conversationId}/history`, { params });
     return response.data;
   }
 
+  trackEvent(event: AnalyticsEvent): void {
+    this.analyticsBuffer.push({ ...event, timestamp: event.timestamp || new Date().toISOString() });
+
+    if (this.analyticsBuffer.length >= ANALYTICS_BATCH_SIZE) {
+      void this.flushAnalytics();
+    } else if (!this.analyticsTimer) {
+      this.analyticsTimer = setTimeout(() => void this.flushAnalytics(), ANALYTICS_FLUSH_INTERVAL_MS);
+    }
+  }
+
+  async flushAnalytics(): Promise<void> {
+    if (this.analyticsTimer) {
+      clearTimeout(this.analyticsTimer);
+      this.analyticsTimer = null;
+    }
+    if (this.analyticsBuffer.length === 0) return;
+
+    const events = this.analyticsBuffer;
+    this.analyticsBuffer = [];
+    try {
+      await this.client.post('/analytics/batch', { events });
+    } catch (error) {
+      // Analytics must never break the chat experience
+      console.error('Failed to send analytics batch:', error);
+    }
+  }
+
+  // sendBeacon outlives the page; text/plain avoids a CORS preflight, which
+  // beacons can't make (the backend parses the body as JSON regardless)
+  flushAnalyticsOnUnload(): void {
+    if (this.analyticsTimer) {
+      clearTimeout(this.analyticsTimer);
+      this.analyticsTimer = null;
+    }
+    if (this.analyticsBuffer.length === 0) return;
+
+    const events = this.analyticsBuffer;
+    this.analyticsBuffer = [];
+    const body = JSON.stringify({ events });
+    const url = `${API_BASE_URL}/analytics/batch`;
+    if (!navigator.sendBeacon?.(url, new Blob([body], { type: 'text/plain' }))) {
+      void fetch(url, { method: 'POST', body, keepalive: true }).catch(() => undefined);
+    }
+  }
+
   async checkHealth(): Promise<any> {
     const response = await this.client.get('/health');
     return response.data;
@@ -7,6 +7,17 @@ import { EscalationBanner } from './EscalationBanner';
 import { chatApi } from '../api/chatApi';
 import type { Message, QuickAction } from '../types';
 
+// Warm retrieval once the user pauses typing
+const PREFETCH_DEBOUNCE_MS = 400;
+const PREFETCH_MIN_LENGTH = 12;
+
+// Identifies this tab's draft to the prefetch scheduler until the first
+// answer assigns a conversation ID (randomUUID needs a secure context)
+const newDraftId = () =>
+  typeof crypto !== 'undefined' && 'randomUUID' in crypto
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
 export const ChatInterface: React.FC = () => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [inputValue, setInputValue] = useState('');
@@ -19,6 +30,7 @@ export const ChatInterface: React.FC = () => {
   
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const inputRef = useRef<HTMLInputElement>(null);
+  const draftIdRef = useRef<string>(newDraftId());
 
   // Scroll to bottom when messages change
   const scrollToBottom = () => {
@@ -29,6 +41,21 @@ export const ChatInterface: React.FC = () => {
     scrollToBottom();
   }, [messages, isLoading]);
 
+  useEffect(() => {
+    const text = inputValue.trim();
+    if (text.length < PREFETCH_MIN_LENGTH || isLoading) return;
+
+    const timer = setTimeout(() => {
+      void chatApi.prefetch({
+        text,
+        conversation_id: conversationId,
+        draft_id: draftIdRef.current,
+      });
+    }, PREFETCH_DEBOUNCE_MS);
+
+    return () => clearTimeout(timer);
+  }, [inputValue, conversationId, isLoading]);
+
   // Load quick actions on mount
   useEffect(() => {
     const loadQuickActions = async () => {
@@ -85,11 +112,19 @@ export const ChatInterface: React.FC = () => {
 
     try {
       // Send to API
+      const startedAt = performance.now();
       const response = await chatApi.sendMessage({
         message: text,
         conversation_id: conversationId,
       });
 
+      chatApi.trackEvent({
+        event_type: 'chat_response',
+        conversation_id: response.conversation_id,
+        response_time_ms: performance.now() - startedAt,
+        category: response.category,
+      });
+
       // Update conversation ID
       if (!conversationId) {
         setConversationId(response.conversation_id);
@@ -103,6 +138,8 @@ export const ChatInterface: React.FC = () => {
         timestamp: new Date().toISOString(),
         sources: response.sources,
         suggestedActions: response.suggested_actions,
+        conversationId: response.conversation_id,
+        category: response.category,
       };
 
       setMessages((prev) => [...prev, assistantMessage]);
@@ -143,8 +180,16 @@ export const ChatInterface: React.FC = () => {
     setError(null);
 
     try {
+      const startedAt = performance.now();
       const response = await chatApi.processQuickAction(actionId, conversationId);
 
+      chatApi.trackEvent({
+        event_type: 'quick_action',
+        conversation_id: response.conversation_id,
+        response_time_ms: performance.now() - startedAt,
+        category: quickActions.find(a => a.id === actionId)?.category || response.category,
+      });
+
       if (!conversationId) {
         setConversationId(response.conversation_id);
       }
@@ -168,6 +213,8 @@ export const ChatInterface: React.FC = () => {
         timestamp: new Date().toISOString(),
         sources: response.sources,
         suggestedActions: response.suggested_actions,
+        conversationId: response.conversation_id,
+        category: action?.category || response.category,
       };
 
       setMessages((prev) => [...prev, userMessage, assistantMessage]);
@@ -194,11 +241,27 @@ export const ChatInterface: React.FC = () => {
         },
       ]);
       setConversationId(undefined);
+      draftIdRef.current = newDraftId();
       setShowEscalation(false);
       setError(null);
     }
   };
 
+  const handleFeedback = (messageId: string, wasHelpful: boolean) => {
+    const message = messages.find((m) => m.id === messageId);
+    if (!message || message.wasHelpful !== undefined) return;
+
+    setMessages((prev) =>
+      prev.map((m) => (m.id === messageId ? { ...m, wasHelpful } : m))
+    );
+    chatApi.trackEvent({
+      event_type: 'feedback',
+      conversation_id: message.conversationId,
+      was_helpful: wasHelpful,
+      category: message.category,
+    });
+  };
+
   const handleKeyPress = (e: React.KeyboardEvent<HTMLInputElement>) => {
     if (e.key === 'Enter' && !e.shiftKey) {
       e.preventDefault();
@@ -276,7 +339,11 @@ export const ChatInterface: React.FC = () => {
 
           {/* Messages */}
           {messages.map((message) => (
-            <MessageBubble key={message.id} message={message} />
+            <MessageBubble
+              key={message.id}
+              message={message}
+              onFeedback={(wasHelpful) => handleFeedback(message.id, wasHelpful)}
+            />
           ))}
 
           {/* Typing Indicator */}
@@ -1,12 +1,13 @@
 import React from 'react';
-import { Bot, User, ExternalLink } from 'lucide-react';
+import { Bot, User, ExternalLink, ThumbsUp, ThumbsDown } from 'lucide-react';
 import type { Message } from '../types';
 
 interface MessageBubbleProps {
   message: Message;
+  onFeedback?: (wasHelpful: boolean) => void;
 }
 
-export const MessageBubble: React.FC<MessageBubbleProps> = ({ message }) => {
+export const MessageBubble: React.FC<MessageBubbleProps> = ({ message, onFeedback }) => {
   const isUser = message.role === 'user';
 
   const formatTime = (timestamp: string) => {
@@ -78,6 +79,33 @@ export const MessageBubble: React.FC<MessageBubbleProps> = ({ message }) => {
             </ul>
           </div>
         )}
+
+        {/* Feedback (answers from the API only, once per message) */}
+        {!isUser && message.conversationId && onFeedback && (
+          <div className="mt-2 px-2 flex items-center gap-2">
+            {message.wasHelpful === undefined ? (
+              <>
+                <span className="text-xs text-gray-500">Was this helpful?</span>
+                <button
+                  onClick={() => onFeedback(true)}
+                  className="p-1 text-gray-400 hover:text-green-600 transition-colors"
+                  title="Helpful"
+                >
+                  <ThumbsUp className="w-3.5 h-3.5" />
+                </button>
+                <button
+                  onClick={() => onFeedback(false)}
+                  className="p-1 text-gray-400 hover:text-red-600 transition-colors"
+                  title="Not helpful"
+                >
+                  <ThumbsDown className="w-3.5 h-3.5" />
+                </button>
+              </>
+            ) : (
+              <span className="text-xs text-gray-500">Thanks for the feedback</span>
+            )}
+          </div>
+        )}
       </div>
     </div>
   );
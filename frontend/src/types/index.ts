@@ -5,12 +5,26 @@ export interface Message {
   timestamp: string;
   sources?: string[];
   suggestedActions?: string[];
+  // Assistant answers only: what feedback is reported against
+  conversationId?: string;
+  category?: string;
+  wasHelpful?: boolean;
 }
 
 export interface ChatRequest {
   message: string;
   conversation_id?: string;
   user_context?: Record<string, any>;
+  tenant_id?: string;
+}
+
+export interface PrefetchRequest {
+  text: string;
+  conversation_id?: string;
+  // Per-tab ID so prefetches are told apart before a conversation exists
+  draft_id?: string;
+  user_context?: Record<string, any>;
+  tenant_id?: string;
 }
 
 export interface ChatResponse {
@@ -20,6 +34,8 @@ export interface ChatResponse {
   confidence?: number;
   suggested_actions?: string[];
   should_escalate: boolean;
+  index_version?: string;
+  category?: string;
 }
 
 export interface QuickAction {
@@ -44,5 +60,16 @@ export interface TicketResponse {
   status: string;
   estimated_response_time: string;
   message: string;
+  incident_id?: string;
+  is_duplicate?: boolean;
 }
 
+export interface AnalyticsEvent {
+  event_type: string;
+  conversation_id?: string;
+  user_query?: string;
+  response_time_ms?: number;
+  was_helpful?: boolean;
+  category?: string;
+  timestamp?: string;
+}